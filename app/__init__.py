@@ -1,39 +1,90 @@
+import os
+import weakref
+
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate  # 导入 Migrate
 from config import Config
-import os
-import logging
-from logging.handlers import RotatingFileHandler
 
 db = SQLAlchemy()
-migrate = Migrate()  # 初始化 Migrate
 
 def create_app():
+    """Build the app without touching the database; schema changes go through ``flask bootstrap`` / ``flask db``."""
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
     app.config.from_object(Config)
+    if app.config['PROXY_FIX_HOPS']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
 
     db.init_app(app)
-    migrate.init_app(app, db)  # 初始化 Migrate 与应用和数据库
+    # flask db 先注册为占位命令组，执行时才导入 Flask-Migrate（连带 alembic）；Web 进程启动时不加载
+    app.cli.add_command(_MigrateGroup(app))
+
+    from . import analytics, assets, auth, cache, dashboard, pagecache, profiling
+    assets.init_app(app)  # 带哈希的静态文件（flask build-assets 生成），长期缓存
+    cache.init_app(app, db.session)  # 下拉选项缓存，提交时按表失效
+    auth.init_app(app)  # 当前用户缓存（users 表提交时失效）与登录限流
+    pagecache.init_app(app)  # 报表正文片段缓存 + ETag/304，提交时按表失效
+    analytics.init_app(app, db.session)  # 报表缓存，提交时按日期区间失效
+    dashboard.init_app(app, db.session)  # 仪表盘指标常驻内存，后台线程定时刷新
+    profiling.init_app(app)  # 请求级 SQL/模板耗时统计，/metrics
 
     with app.app_context():
         from . import routes
         routes.register_routes(app)
-        db.create_all()
+        from . import commands
+        commands.register_commands(app)
 
-    # Configure logging
+    # Configure logging: JSON 日志经队列由后台线程写盘，请求线程不阻塞在磁盘 I/O 上
+    from . import eventlog
+    eventlog.init_app(app)
     if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-
-        app.logger.setLevel(logging.INFO)
         app.logger.info('Application startup')
 
+    # gunicorn --preload 等在 create_app 之后 fork 出 worker，子进程需要自己的连接和日志线程
+    if hasattr(os, 'register_at_fork'):
+        ref = weakref.ref(app)
+        os.register_at_fork(after_in_child=lambda: _after_fork(ref))
+
     return app
 
+
+def init_migrate(app):
+    """Register Flask-Migrate on ``app`` the first time migrations are needed and return its config."""
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        Migrate(app, db)  # 同时把真正的 flask db 命令组挂到 app.cli 上，替换占位组
+    return app.extensions['migrate']
+
+
+class _MigrateGroup(click.Group):
+    """``flask db``: Flask-Migrate's command group, loaded on first use."""
+
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    def _commands(self):
+        init_migrate(self.app)
+        from flask_migrate.cli import db as group
+        return group
+
+    def list_commands(self, ctx):
+        return self._commands().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._commands().get_command(ctx, name)
+
+
+def _after_fork(ref):
+    app = ref()
+    if app is None:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            # close=False：继承来的连接仍属于父进程，子进程只丢弃引用、按需新建
+            engine.dispose(close=False)
+    from . import eventlog
+    eventlog.after_fork(app)
+
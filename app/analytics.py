@@ -0,0 +1,192 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event, func, select
+
+from . import db
+from .cache import VersionedCache
+from .models import Medicine, Customer, Sale, Return, Financial
+
+PERIODS = ('day', 'week', 'month')
+ROLLING_DAYS = 7
+DEFAULT_TOP = 10
+# numpy 在各函数内导入：报表第一次计算时才加载，不计入应用启动时间
+
+# 按 (报表, 开始, 结束, 参数...) 缓存；新的销售/退货落在某个区间内时只丢弃覆盖该日期的条目。
+# 丢弃只发生在提交的进程里，其他 worker 靠 TTL 过期
+reports = VersionedCache(maxsize=256, ttl=60)
+
+
+def cached(name, start, end, loader, *params):
+    return reports.get((name, start, end) + params, (), loader)
+
+
+def touch(*days):
+    """Mark dates whose sales or returns changed; matching reports are dropped after commit."""
+    db.session.info.setdefault('analytics_days', set()).update(days)
+
+
+def _after_commit(session):
+    days = session.info.pop('analytics_days', None)
+    if days:
+        reports.discard(lambda key: any(key[1] <= day <= key[2] for day in days))
+
+
+def _after_rollback(session):
+    session.info.pop('analytics_days', None)
+
+
+def _days(start, end):
+    import numpy as np
+    return np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+
+
+def _bucket_starts(days, period):
+    import numpy as np
+    if period == 'week':
+        # 1970-01-05 是星期一，按周一对齐
+        return ((days - np.datetime64('1970-01-05')) // 7) * 7 + np.datetime64('1970-01-05')
+    if period == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    return days
+
+
+def _rolling_mean(values, window):
+    import numpy as np
+    if not len(values):
+        return values
+    sums = np.convolve(values, np.ones(window), mode='full')[:len(values)]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def _daily(start, end):
+    import numpy as np
+    # 直接读取 financials 日汇总，不扫描 sales
+    days = _days(start, end)
+    sales = np.zeros(len(days))
+    returns = np.zeros(len(days))
+    rows = db.session.execute(
+        select(Financial.date, Financial.total_sales, Financial.total_returns)
+        .where(Financial.date.between(start, end))).all()
+    if rows:
+        index = (np.array([np.datetime64(row[0], 'D') for row in rows]) - days[0]).astype(int)
+        sales[index] = np.array([float(row[1] or 0) for row in rows])
+        returns[index] = np.array([float(row[2] or 0) for row in rows])
+    return days, sales, returns
+
+
+def revenue(start, end, period='day'):
+    """Revenue per day/week/month with a rolling daily mean and daily percentiles."""
+    def load():
+        import numpy as np
+        days, sales, returns = _daily(start, end)
+        net = sales - returns
+        rolling = _rolling_mean(net, ROLLING_DAYS)
+        buckets, first = np.unique(_bucket_starts(days, period), return_index=True)
+        rows = []
+        if len(days):
+            sales_sum = np.add.reduceat(sales, first)
+            returns_sum = np.add.reduceat(returns, first)
+            # 每个区间最后一天的滚动均值
+            last = np.append(first[1:], len(days)) - 1
+            for i, bucket in enumerate(buckets):
+                rows.append({'period': bucket.astype(date), 'sales': round(float(sales_sum[i]), 2),
+                             'returns': round(float(returns_sum[i]), 2),
+                             'net': round(float(sales_sum[i] - returns_sum[i]), 2),
+                             'rolling_mean': round(float(rolling[last[i]]), 2)})
+        p50, p90 = np.percentile(net, [50, 90]) if len(net) else (0.0, 0.0)
+        return {'rows': rows, 'sales': round(float(sales.sum()), 2), 'returns': round(float(returns.sum()), 2),
+                'net': round(float(net.sum()), 2), 'daily_p50': round(float(p50), 2),
+                'daily_p90': round(float(p90), 2)}
+    return cached('revenue', start, end, load, period)
+
+
+def comparison(start, end):
+    """Totals for ``start..end`` against the equally long period right before it."""
+    length = (end - start).days + 1
+    previous_end = start - timedelta(days=1)
+    current = revenue(start, end)
+    previous = revenue(previous_end - timedelta(days=length - 1), previous_end)
+    result = {'previous_start': previous_end - timedelta(days=length - 1), 'previous_end': previous_end}
+    for key in ('sales', 'returns', 'net'):
+        before, now = previous[key], current[key]
+        result[key] = {'current': now, 'previous': before,
+                       'change': round((now - before) / abs(before) * 100, 1) if before else None}
+    return result
+
+
+def _top(name, key_column, label_column, start, end, limit, by):
+    def load():
+        import numpy as np
+        revenue_sum = func.sum(Sale.total_price).label('revenue')
+        quantity_sum = func.sum(Sale.quantity).label('quantity')
+        stmt = select(key_column, label_column, revenue_sum, quantity_sum) \
+            .join(label_column.class_, key_column == label_column.class_.id) \
+            .where(Sale.sale_date.between(start, end)) \
+            .group_by(key_column, label_column) \
+            .order_by((quantity_sum if by == 'quantity' else revenue_sum).desc()) \
+            .limit(limit)
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            return []
+        values = np.array([float(row.revenue or 0) for row in rows])
+        total = float(db.session.execute(
+            select(func.coalesce(func.sum(Financial.total_sales), 0))
+            .where(Financial.date.between(start, end))).scalar())
+        share = values / total * 100 if total else np.zeros(len(values))
+        return [{'id': row[0], 'name': row[1], 'revenue': round(float(row.revenue or 0), 2),
+                 'quantity': int(row.quantity or 0), 'share': round(float(s), 1),
+                 'cumulative_share': round(float(c), 1)}
+                for row, s, c in zip(rows, share, np.cumsum(share))]
+    return cached(name, start, end, load, limit, by)
+
+
+def top_medicines(start, end, limit=DEFAULT_TOP, by='revenue'):
+    return _top('top_medicines', Sale.medicine_id, Medicine.name, start, end, limit, by)
+
+
+def top_customers(start, end, limit=DEFAULT_TOP, by='revenue'):
+    return _top('top_customers', Sale.customer_id, Customer.name, start, end, limit, by)
+
+
+def return_rates(start, end, limit=DEFAULT_TOP):
+    """Share of the units sold in the range that were returned, highest first."""
+    def load():
+        import numpy as np
+        # 销量和退货量分两条按药品分组的查询：外连接全部退货的汇总子查询会让优化器放弃 sale_date 索引、扫描整张 sales
+        rows = db.session.execute(
+            select(Sale.medicine_id, Medicine.name, func.sum(Sale.quantity))
+            .join(Medicine, Sale.medicine_id == Medicine.id)
+            .where(Sale.sale_date.between(start, end))
+            .group_by(Sale.medicine_id, Medicine.name)).all()
+        if not rows:
+            return []
+        returned = dict(db.session.execute(
+            select(Sale.medicine_id, func.sum(Return.quantity))
+            .join(Sale, Return.sale_id == Sale.id)
+            .where(Sale.sale_date.between(start, end))
+            .group_by(Sale.medicine_id)).all())
+        kept = np.array([row[2] or 0 for row in rows], dtype=float)
+        back = np.array([returned.get(row[0]) or 0 for row in rows], dtype=float)
+        sold = kept + back  # sales.quantity 已扣除退货，加回去得到原始销量
+        rates = np.divide(back, sold, out=np.zeros_like(back), where=sold > 0) * 100
+        candidates = np.flatnonzero(back)
+        order = candidates[np.argsort(-rates[candidates], kind='stable')][:limit]
+        return [{'id': rows[i][0], 'name': rows[i][1], 'sold': int(sold[i]), 'returned': int(back[i]),
+                 'rate': round(float(rates[i]), 1)}
+                for i in order]
+    return cached('return_rates', start, end, load, limit)
+
+
+def default_range(today=None):
+    end = today or date.today()
+    return end - timedelta(days=29), end
+
+
+def init_app(app, session):
+    # 不能比报表正文片段活得更久，否则片段重新渲染时仍拿到其他 worker 提交之前的分析结果
+    ttl = app.config.get('ANALYTICS_CACHE_TTL', reports.ttl)
+    reports.ttl = min(ttl, app.config.get('REPORT_CACHE_TTL', ttl))
+    if not event.contains(session, 'after_commit', _after_commit):
+        event.listen(session, 'after_commit', _after_commit)
+        event.listen(session, 'after_rollback', _after_rollback)
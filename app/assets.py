@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import request, send_from_directory
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+CACHE_SECONDS = 365 * 24 * 3600
+TEXT_TYPES = ('.css', '.js', '.svg', '.json', '.txt')
+IMAGE_TYPES = ('.png', '.jpg', '.jpeg')
+IMAGE_MAX_WIDTH = 1920  # 页头背景按最宽屏幕缩放，再大没有意义
+IMAGE_QUALITY = 80
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # 按优先级
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+class Asset:
+    def __init__(self, source, target, source_size, size, compressed):
+        self.source = source
+        self.target = target
+        self.source_size = source_size
+        self.size = size
+        self.compressed = compressed  # {编码: 字节数}
+
+
+def _sources(static_folder):
+    for root, dirs, names in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == DIST or rel_root.startswith(DIST + os.sep):
+            continue
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in names:
+            if not name.startswith('.'):
+                yield posixpath.normpath(posixpath.join(rel_root.replace(os.sep, '/'), name))
+
+
+def _hashed_name(path, data):
+    stem, ext = posixpath.splitext(path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def _reencode_image(path, data):
+    """Shrink to ``IMAGE_MAX_WIDTH`` and re-encode as WebP; keeps the original when that is not smaller."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        if image.width > IMAGE_MAX_WIDTH:
+            image = image.resize((IMAGE_MAX_WIDTH, round(image.height * IMAGE_MAX_WIDTH / image.width)),
+                                 Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'WEBP', quality=IMAGE_QUALITY, method=6)
+    if output.tell() >= len(data):
+        return path, data
+    return posixpath.splitext(path)[0] + '.webp', output.getvalue()
+
+
+def _rewrite_css(path, data, files, static_url_path):
+    """Point ``url(...)`` references at the hashed files, relative to the stylesheet's own dist directory."""
+    base = posixpath.join(DIST, posixpath.dirname(path))
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(static_url_path + '/'):
+            target = ref[len(static_url_path) + 1:]
+        elif ref.startswith(('/', 'data:', '#')) or '://' in ref:
+            return match.group(0)
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(path), ref))
+        if target not in files:
+            return match.group(0)
+        return f"url('{posixpath.relpath(files[target], base)}')"
+
+    return _CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def _precompress(path, data):
+    import brotli
+
+    sizes = {}
+    for coding, suffix in ENCODINGS:
+        # mtime=0 让相同内容每次生成相同的 .gz
+        packed = brotli.compress(data, quality=11) if coding == 'br' else gzip.compress(data, 9, mtime=0)
+        if len(packed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(packed)
+            sizes[coding] = len(packed)
+    return sizes
+
+
+def build(static_folder, static_url_path='/static'):
+    """Write content-hashed copies of everything under ``static/`` to ``static/dist`` plus a manifest.
+
+    Images are resized and re-encoded, stylesheets get their ``url()``
+    references rewritten to the hashed names, and text assets get ``.br``
+    and ``.gz`` siblings. Files from earlier builds are left in place so
+    pages already open in a browser keep their styles. Returns the list of
+    :class:`Asset` written.
+    """
+    dist = os.path.join(static_folder, DIST)
+    files, encodings, assets = {}, {}, []
+    # 样式表引用图片，放在最后处理
+    for path in sorted(_sources(static_folder), key=lambda p: (p.endswith('.css'), p)):
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        source_size = len(data)
+        name = path
+        if path.lower().endswith(IMAGE_TYPES):
+            name, data = _reencode_image(path, data)
+        elif path.endswith('.css'):
+            data = _rewrite_css(path, data, files, static_url_path)
+        target = posixpath.join(DIST, _hashed_name(name, data))
+        output = os.path.join(static_folder, *target.split('/'))
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'wb') as f:
+            f.write(data)
+        compressed = _precompress(output, data) if name.endswith(TEXT_TYPES) else {}
+        files[path] = target
+        if compressed:
+            encodings[target] = [coding for coding, _ in ENCODINGS if coding in compressed]
+        assets.append(Asset(path, target, source_size, len(data), compressed))
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'files': files, 'encodings': encodings}, f, indent=2, sort_keys=True)
+    return assets
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}, {}
+    return manifest['files'], manifest['encodings']
+
+
+def init_app(app):
+    """Map ``url_for('static', ...)`` to the hashed files from ``flask build-assets`` and serve them.
+
+    Without a manifest (development) the original files are served as before.
+    The manifest is read once; restart the app after rebuilding.
+    """
+    files, encodings = load_manifest(app.static_folder)
+    app.extensions['assets'] = files
+    if not files:
+        return
+
+    @app.url_defaults
+    def hashed_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in files:
+            values['filename'] = files[values['filename']]
+
+    default_static = app.view_functions['static']
+
+    def static(filename):
+        if not filename.startswith(DIST + '/'):
+            return default_static(filename=filename)
+        response = None
+        for coding in encodings.get(filename, ()):
+            if request.accept_encodings[coding]:
+                suffix = dict(ENCODINGS)[coding]
+                response = send_from_directory(app.static_folder, filename + suffix, max_age=CACHE_SECONDS,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = coding
+                break
+        if response is None:
+            response = send_from_directory(app.static_folder, filename, max_age=CACHE_SECONDS)
+        if filename in encodings:
+            response.vary.add('Accept-Encoding')
+        # 文件名含内容哈希，内容变了 URL 也会变：浏览器无需再验证
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, session
+from sqlalchemy import select
+
+from . import db
+from .cache import VersionedCache, track
+from .models import User
+
+# 当前用户按 user_id 缓存；users 表有提交时整体失效
+users = VersionedCache(maxsize=1024, ttl=60)
+
+
+class CurrentUser:
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+
+
+def _load(user_id):
+    row = db.session.execute(select(User.id, User.username, User.is_admin).where(User.id == user_id)).first()
+    return CurrentUser(*row) if row else None
+
+
+def current_user():
+    """The logged-in user for this request, or None; cached per request and across requests."""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        user = users.get(user_id, ('users',), lambda: _load(user_id)) if user_id is not None else None
+        if user is None and user_id is not None:
+            # 用户已被删除：清掉会话，按未登录处理
+            session.pop('user_id', None)
+        g.current_user = user
+    return g.current_user
+
+
+class LoginThrottle:
+    """Failed logins per username and per client IP within a sliding window, kept per process.
+
+    :meth:`retry_after` is checked before the user is loaded or a password
+    hashed, so a burst of bad attempts costs no hashing once over the limit.
+    """
+
+    def __init__(self, max_per_user=5, max_per_ip=20, window=900, maxsize=10000):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self.maxsize = maxsize
+        self._failures = OrderedDict()  # 键 -> 失败时间列表
+        self._lock = threading.Lock()
+
+    def _keys(self, username, ip):
+        return (('user', username.strip().lower()), self.max_per_user), (('ip', ip), self.max_per_ip)
+
+    def _recent(self, key, now):
+        times = [t for t in self._failures.get(key, ()) if t > now - self.window]
+        if times:
+            self._failures[key] = times
+        else:
+            self._failures.pop(key, None)
+        return times
+
+    def retry_after(self, username, ip):
+        """Seconds until another attempt is allowed; 0 when not throttled."""
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for key, limit in self._keys(username, ip):
+                times = self._recent(key, now)
+                if len(times) >= limit:
+                    wait = max(wait, times[-limit] + self.window - now)
+        return int(wait) + 1 if wait else 0
+
+    def failed(self, username, ip):
+        now = time.monotonic()
+        with self._lock:
+            for key, _ in self._keys(username, ip):
+                self._failures[key] = self._recent(key, now) + [now]
+                self._failures.move_to_end(key)
+            while len(self._failures) > self.maxsize:
+                self._failures.popitem(last=False)
+
+    def succeeded(self, username):
+        with self._lock:
+            self._failures.pop(('user', username.strip().lower()), None)
+
+
+throttle = LoginThrottle()
+
+
+def init_app(app):
+    users.ttl = app.config.get('AUTH_USER_CACHE_TTL', users.ttl)
+    throttle.window = app.config.get('LOGIN_WINDOW_SECONDS', throttle.window)
+    throttle.max_per_user = app.config.get('LOGIN_MAX_FAILURES_PER_USER', throttle.max_per_user)
+    throttle.max_per_ip = app.config.get('LOGIN_MAX_FAILURES_PER_IP', throttle.max_per_ip)
+    track(users, {'users': None})
+    app.context_processor(lambda: {'current_user': current_user()})
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import sqlalchemy as sa
+
+DUMP_DIR = 'Dump-med_sales_db'
+BATCH_BYTES = 1024 * 1024  # 合并后单条 INSERT 的上限，需小于 max_allowed_packet
+
+metadata = sa.MetaData()
+bootstrap_log = sa.Table(
+    'bootstrap_log', metadata,
+    sa.Column('filename', sa.String(255), primary_key=True),
+    sa.Column('checksum', sa.String(64), nullable=False),
+    sa.Column('rows_loaded', sa.Integer, nullable=False),
+    sa.Column('loaded_at', sa.DateTime, nullable=False),
+)
+
+_SPECIAL = re.compile(r"[;'\"`#]|--(?=\s|$)|/\*!?")
+_QUOTE_END = {
+    "'": re.compile(r"\\.|''|'", re.S),
+    '"': re.compile(r'\\.|""|"', re.S),
+    '`': re.compile(r'``|`'),
+}
+_INSERT = re.compile(r'INSERT\s+INTO\s+.+?\s+VALUES\s*', re.I | re.S)
+_CREATE = re.compile(r'CREATE TABLE\s+`?(\w+)`?', re.I)
+_REFERENCES = re.compile(r'REFERENCES\s+`?(\w+)`?', re.I)
+
+
+class DumpConflict(Exception):
+    """Loading would drop tables that hold data the dumps did not put there."""
+
+
+class DumpResult:
+    def __init__(self, filename, table, rows=0, seconds=0.0, skipped=False):
+        self.filename = filename
+        self.table = table
+        self.rows = rows
+        self.seconds = seconds
+        self.skipped = skipped
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def iter_statements(lines):
+    """Split an SQL dump into statements, streaming line by line.
+
+    Semicolons inside quoted strings, identifiers and comments do not end a
+    statement. ``--``/``#``/``/* */`` comments are dropped; MySQL executable
+    comments (``/*!40101 ... */``) are kept as statement text.
+    """
+    buf = []
+    quote = None
+    comment = False
+    for line in lines:
+        pos, end = 0, len(line)
+        while pos < end:
+            if comment:
+                close = line.find('*/', pos)
+                if close < 0:
+                    break
+                comment = False
+                pos = close + 2
+            elif quote:
+                pattern = _QUOTE_END[quote]
+                while True:
+                    m = pattern.search(line, pos)
+                    if m is None:
+                        buf.append(line[pos:])
+                        pos = end
+                        break
+                    buf.append(line[pos:m.end()])
+                    pos = m.end()
+                    if m.group() == quote:
+                        quote = None
+                        break
+            else:
+                m = _SPECIAL.search(line, pos)
+                if m is None:
+                    buf.append(line[pos:])
+                    break
+                buf.append(line[pos:m.start()])
+                token = m.group()
+                pos = m.end()
+                if token == ';':
+                    statement = ''.join(buf).strip()
+                    buf = []
+                    if statement:
+                        yield statement
+                elif token in _QUOTE_END:
+                    quote = token
+                    buf.append(token)
+                elif token == '/*!':
+                    buf.append(token)
+                elif token == '/*':
+                    comment = True
+                else:
+                    buf.append('\n')
+                    pos = end
+    statement = ''.join(buf).strip()
+    if statement:
+        yield statement
+
+
+def batch_inserts(statements, max_bytes=BATCH_BYTES):
+    """Merge consecutive ``INSERT INTO t VALUES ...`` statements into multi-row inserts."""
+    prefix, values, size = None, [], 0
+    for statement in statements:
+        m = _INSERT.match(statement)
+        if m and m.group() == prefix and size + len(statement) < max_bytes:
+            values.append(statement[m.end():])
+            size += len(statement) - m.end() + 1
+            continue
+        if prefix:
+            yield prefix + ','.join(values)
+            prefix, values, size = None, [], 0
+        if m:
+            prefix, values, size = m.group(), [statement[m.end():]], len(statement)
+        else:
+            yield statement
+    if prefix:
+        yield prefix + ','.join(values)
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _scan(path):
+    table, references = None, set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if table is None:
+                m = _CREATE.search(line)
+                if m:
+                    table = m.group(1)
+            references.update(_REFERENCES.findall(line))
+    if table is None:
+        table = os.path.splitext(os.path.basename(path))[0]
+    references.discard(table)
+    return table, references
+
+
+def plan(paths):
+    """Group dump files into levels; files in one level only depend on earlier levels."""
+    tables = {path: _scan(path) for path in paths}
+    known = {table for table, _ in tables.values()}
+    pending = {path: refs & known for path, (table, refs) in tables.items()}
+    loaded, levels = set(), []
+    while pending:
+        level = sorted(path for path, refs in pending.items() if refs <= loaded)
+        if not level:
+            # 循环引用：剩余文件放在最后一层（dump 本身关闭了外键检查）
+            level = sorted(pending)
+        levels.append([(path, tables[path][0]) for path in level])
+        for path in level:
+            loaded.add(tables[path][0])
+            del pending[path]
+    return levels
+
+
+def _load_file(engine, path, table, checksum, batch_bytes):
+    filename = os.path.basename(path)
+    started = time.perf_counter()
+    rows = 0
+    with engine.begin() as conn:
+        raw = conn.execution_options(no_parameters=True)
+        with open(path, encoding='utf-8') as f:
+            for statement in batch_inserts(iter_statements(f), batch_bytes):
+                result = raw.exec_driver_sql(statement)
+                if _INSERT.match(statement):
+                    rows += max(result.rowcount, 0)
+        conn.execute(bootstrap_log.delete().where(bootstrap_log.c.filename == filename))
+        conn.execute(bootstrap_log.insert().values(filename=filename, checksum=checksum,
+                                                   rows_loaded=rows, loaded_at=datetime.now()))
+    return DumpResult(filename, table, rows, time.perf_counter() - started)
+
+
+def load_dumps(engine, directory=DUMP_DIR, workers=4, force=False, batch_bytes=BATCH_BYTES):
+    """Load every ``*.sql`` dump in ``directory`` once.
+
+    Files already recorded in ``bootstrap_log`` with the same checksum are
+    skipped unless ``force`` is set. The dumps start with ``DROP TABLE``, so
+    without ``force`` a file is only loaded into a database that is still
+    unmigrated and does not already have that table from somewhere other
+    than the dumps; otherwise :class:`DumpConflict` is raised before
+    anything is touched. Independent tables are loaded concurrently, one
+    connection each.
+    """
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.sql'))
+    existing = table_names(engine)
+    done = {}
+    if 'bootstrap_log' in existing:
+        with engine.connect() as conn:
+            done = dict(conn.execute(sa.select(bootstrap_log.c.filename, bootstrap_log.c.checksum)).all())
+
+    levels = plan(paths)
+    checksums = {path: _checksum(path) for level in levels for path, _ in level}
+    if not force:
+        pending = [(path, table) for level in levels for path, table in level
+                   if done.get(os.path.basename(path)) != checksums[path]]
+        if pending and 'alembic_version' in existing:
+            raise DumpConflict('数据库已由迁移管理（存在 alembic_version），导入转储会删除现有数据；确需覆盖请加 --force。')
+        unlogged = sorted(table for path, table in pending
+                          if table in existing and os.path.basename(path) not in done)
+        if unlogged:
+            raise DumpConflict(f'表 {", ".join(unlogged)} 已存在且不是由转储导入的，导入会删除其中的数据；'
+                               '确需覆盖请加 --force。')
+    metadata.create_all(engine, checkfirst=True)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for level in levels:
+            futures = []
+            for path, table in level:
+                checksum = checksums[path]
+                if not force and done.get(os.path.basename(path)) == checksum:
+                    results.append(DumpResult(os.path.basename(path), table, skipped=True))
+                    continue
+                futures.append(pool.submit(_load_file, engine, path, table, checksum, batch_bytes))
+            results.extend(future.result() for future in futures)
+    return results
+
+
+def create_database(url):
+    """``CREATE DATABASE IF NOT EXISTS`` for the database named in ``url``; SQLite creates its file on connect."""
+    url = sa.engine.make_url(url)
+    if url.get_backend_name() == 'sqlite' or not url.database:
+        return
+    engine = sa.create_engine(url.set(database=None))
+    try:
+        with engine.connect() as conn:
+            name = engine.dialect.identifier_preparer.quote(url.database)
+            conn.execute(sa.text(f'CREATE DATABASE IF NOT EXISTS {name}'))
+    finally:
+        engine.dispose()
+
+
+def table_names(engine):
+    return set(sa.inspect(engine).get_table_names())
+
+
+def summary(results):
+    loaded = [r for r in results if not r.skipped]
+    rows = sum(r.rows for r in loaded)
+    seconds = sum(r.seconds for r in loaded)
+    rate = rows / seconds if seconds else 0.0
+    return (f'导入 {len(loaded)} 个文件 ({len(results) - len(loaded)} 个跳过), '
+            f'{rows} 行, 每连接 {rate:.0f} 行/秒')
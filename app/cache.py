@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import event, inspect
+
+# 表名 -> 参与缓存的列；None 表示任何改动都失效
+WATCHED_COLUMNS = {
+    'medicines': {'name'},
+    'customers': {'name'},
+    'suppliers': {'name'},
+}
+
+
+class VersionedCache:
+    """Small in-process LRU cache with TTL.
+
+    Keys are any hashable (e.g. ``('medicines', q, limit)``). Every entry records the version of the tables it was built from;
+    :meth:`invalidate` bumps those versions so stale entries miss on the next read.
+    """
+
+    def __init__(self, maxsize=64, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _version(self, tables):
+        return tuple(self._versions[t] for t in tables)
+
+    def get(self, key, tables, loader):
+        now = time.monotonic()
+        with self._lock:
+            version = self._version(tables)
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def version(self, tables):
+        """Current change counters of ``tables`` in this process; they move on every invalidation."""
+        with self._lock:
+            return self._version(tables)
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def discard(self, predicate):
+        """Drop the entries whose key matches ``predicate``; returns how many were dropped."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'versions': dict(self._versions),
+            }
+
+
+reference_data = VersionedCache()
+
+
+def track(cache, watched):
+    """Bump ``cache``'s table versions whenever a commit changes one of ``watched``
+    (table name -> watched columns, None for any change)."""
+    cache.watched = watched
+    if cache not in _tracked:
+        _tracked.append(cache)
+    _watched_tables.update(watched)
+
+
+_tracked = []
+_watched_tables = set()
+
+
+def _touches(watched, table, columns):
+    if table not in watched:
+        return False
+    if watched[table] is None:
+        return True
+    return columns is None or bool(watched[table] & columns)
+
+
+def _note(session, table, columns):
+    # 表名 -> 改动过的列；None 表示新增/删除或无法确定的列
+    changed = session.info.setdefault('changed_columns', {})
+    if columns is None or changed.get(table, ()) is None:
+        changed[table] = None
+    else:
+        changed.setdefault(table, set()).update(columns)
+
+
+def _after_flush(session, flush_context):
+    for obj in session.new | session.deleted:
+        table = obj.__table__.name
+        if table in _watched_tables:
+            _note(session, table, None)
+    for obj in session.dirty:
+        table = obj.__table__.name
+        if table not in _watched_tables:
+            continue
+        state = inspect(obj)
+        columns = {attr.key for attr in state.attrs if attr.history.has_changes()}
+        if columns:
+            _note(session, table, columns)
+
+
+def _do_orm_execute(state):
+    # 批量 insert/update/delete 不走 flush，需要单独记录
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, 'table', None)
+    if table is None or table.name not in _watched_tables:
+        return
+    columns = None
+    if state.is_update and getattr(state.statement, '_values', None):
+        columns = {getattr(column, 'key', column) for column in state.statement._values}
+    _note(state.session, table.name, columns)
+
+
+def _after_commit(session):
+    changed = session.info.pop('changed_columns', None)
+    if not changed:
+        return
+    for cache in _tracked:
+        tables = [table for table, columns in changed.items() if _touches(cache.watched, table, columns)]
+        if tables:
+            cache.invalidate(*tables)
+
+
+def _after_rollback(session):
+    session.info.pop('changed_columns', None)
+
+
+def init_app(app, session):
+    track(reference_data, WATCHED_COLUMNS)
+    reference_data.ttl = app.config.get('REFERENCE_CACHE_TTL', reference_data.ttl)
+    reference_data.maxsize = app.config.get('REFERENCE_CACHE_SIZE', reference_data.maxsize)
+    if not event.contains(session, 'after_commit', _after_commit):
+        event.listen(session, 'after_flush', _after_flush)
+        event.listen(session, 'do_orm_execute', _do_orm_execute)
+        event.listen(session, 'after_commit', _after_commit)
+        event.listen(session, 'after_rollback', _after_rollback)
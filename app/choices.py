@@ -0,0 +1,14 @@
+from sqlalchemy import select
+
+from . import db
+from .cache import reference_data
+from .models import Supplier
+
+
+def _rows(stmt):
+    return [tuple(row) for row in db.session.execute(stmt)]
+
+
+def supplier_choices():
+    return reference_data.get('suppliers', ('suppliers',),
+                              lambda: _rows(select(Supplier.id, Supplier.name).order_by(Supplier.name, Supplier.id)))
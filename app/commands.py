@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+
+import click
+
+from . import db, init_migrate, assets, bootstrap, export, financials, importer, ledger, reconcile, reorder
+
+
+def register_commands(app):
+    @app.cli.command('export')
+    @click.argument('name', type=click.Choice(sorted(export.EXPORTS)))
+    @click.option('--format', 'fmt', type=click.Choice(sorted(export.FORMATS)), default='csv')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='起始日期 (含)')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='结束日期 (含)')
+    @click.option('--medicine-id', type=int)
+    @click.option('--customer-id', type=int)
+    @click.option('--supplier-id', type=int)
+    @click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-')
+    def export_command(name, fmt, start, end, medicine_id, customer_id, supplier_id, output):
+        """Stream a table to CSV or NDJSON without loading it into memory."""
+        filters = {'medicine_id': medicine_id, 'customer_id': customer_id, 'supplier_id': supplier_id}
+        filters = {k: v for k, v in filters.items() if v is not None}
+        try:
+            stmt = export.build_query(name,
+                                      start=start.date() if start else None,
+                                      end=end.date() if end else None,
+                                      **filters)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        for chunk in export.stream_rows(stmt, fmt):
+            output.write(chunk)
+        if output is not sys.stdout:
+            click.echo(f'已导出 {name} 到 {output.name}', err=True)
+
+    @app.cli.command('rebuild-financials')
+    @click.option('--check', is_flag=True, help='只报告偏差，不写回')
+    def rebuild_financials_command(check):
+        """Recompute daily/monthly financial rollups from sales and returns and report drift."""
+        unpriced = financials.missing_prices() if check else (0, 0)
+        drift = financials.rebuild(repair=not check)
+        for kind, key, stored, expected in drift:
+            click.echo(f'{kind} {key}: 销售/退货 {stored[0]}/{stored[1]} -> {expected[0]}/{expected[1]}')
+        if any(unpriced):
+            # 检查模式不补价格，缺退款金额的退货按 0 计入上面的预期值
+            click.echo(f'{unpriced[0]} 条销售缺少成交单价、{unpriced[1]} 条退货缺少退款金额，'
+                       '去掉 --check 运行可补齐。')
+        if not drift and not any(unpriced):
+            click.echo('财务汇总与原始数据一致。')
+        elif check:
+            if drift:
+                click.echo(f'发现 {len(drift)} 处偏差。')
+            sys.exit(1)
+        else:
+            click.echo(f'已修复 {len(drift)} 处偏差。')
+
+    @app.cli.command('reconcile-inventory')
+    @click.option('--repair', is_flag=True, help='按进货/销售流水修正 stock 和 inventory，并删除重复行')
+    def reconcile_inventory_command(repair):
+        """Check medicines.stock and inventory against opening stock + purchases - sales."""
+        found = reconcile.reconcile(repair=repair)
+        for d in found:
+            notes = []
+            if d.baseline_missing:
+                notes.append('缺少初始库存，以当前 stock 为准')
+            if d.duplicates:
+                notes.append(f'{d.duplicates} 条重复库存行')
+            if d.inventory is None:
+                notes.append('缺少库存行')
+            click.echo(f'{d.medicine_id} {d.name}: stock {d.stock} / inventory {d.inventory} / '
+                       f'流水 {d.ledger_balance} -> {d.expected}'
+                       + (f' ({"; ".join(notes)})' if notes else ''))
+        if not found:
+            click.echo('库存与进销流水一致。')
+        elif repair:
+            click.echo(f'已修复 {len(found)} 种药品的库存。')
+        else:
+            click.echo(f'发现 {len(found)} 种药品库存不一致。')
+            sys.exit(1)
+
+    @app.cli.command('rebuild-sales-velocity')
+    def rebuild_sales_velocity_command():
+        """Recompute the per-medicine daily sales rollup used by the reorder report."""
+        click.echo(f'已重建 {reorder.rebuild()} 行每日销量。')
+
+    @app.cli.command('snapshot-stock')
+    @click.option('--date', 'day', type=click.DateTime(formats=['%Y-%m-%d']), help='快照日期，默认昨天')
+    def snapshot_stock_command(day):
+        """Store each medicine's closing stock for a finished day; run nightly from cron."""
+        try:
+            count = ledger.take_snapshots(day.date() if day else None)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--date')
+        click.echo(f'已生成 {count} 条库存快照。')
+
+    @app.cli.command('import-csv')
+    @click.argument('kind', type=click.Choice(sorted(importer.IMPORTERS)))
+    @click.argument('source', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--chunk-size', type=int, default=importer.CHUNK_SIZE, show_default=True)
+    def import_csv_command(kind, source, chunk_size):
+        """Import medicines, purchases or customers from a CSV file in batches."""
+        result = importer.import_csv(kind, source, chunk_size=chunk_size)
+        for line, message in result.errors:
+            click.echo(f'第 {line} 行: {message}', err=True)
+        click.echo(f'已导入 {result.imported} 行，{len(result.errors)} 行有错误。')
+        if result.errors:
+            sys.exit(1)
+
+    @app.cli.command('bootstrap')
+    @click.option('--dumps/--no-dumps', default=True, help='新数据库先导入 SQL 转储作为初始数据')
+    @click.option('--directory', default=bootstrap.DUMP_DIR, show_default=True)
+    @click.option('--workers', type=int, default=4, show_default=True, help='并行加载的连接数')
+    def bootstrap_command(dumps, directory, workers):
+        """Create the database and bring its schema to the latest migration; run once before the first start.
+
+        A new database is seeded from the SQL dumps (the schema before the first
+        migration) and then upgraded; without dumps the current models are
+        created and stamped. Existing databases are only upgraded.
+        """
+        from flask_migrate import stamp, upgrade
+
+        init_migrate(app)
+        bootstrap.create_database(app.config['SQLALCHEMY_DATABASE_URI'])
+        tables = bootstrap.table_names(db.engine)
+        if 'alembic_version' not in tables:
+            # bootstrap_log 说明表是之前由转储导入的，仍处于第一个迁移之前
+            if tables and 'bootstrap_log' not in tables:
+                raise click.ClickException('数据库已有表但没有迁移记录；请先用 flask db stamp <版本> 标记当前结构。')
+            has_dumps = os.path.isdir(directory) and any(name.endswith('.sql') for name in os.listdir(directory))
+            if dumps and has_dumps:
+                try:
+                    click.echo(bootstrap.summary(bootstrap.load_dumps(db.engine, directory, workers=workers)))
+                except bootstrap.DumpConflict as e:
+                    raise click.ClickException(str(e))
+            elif 'bootstrap_log' not in tables:
+                db.create_all()
+                stamp()
+                click.echo('已按当前模型建表并标记为最新版本。')
+                return
+        upgrade()
+        click.echo('数据库结构已是最新版本。')
+
+    @app.cli.command('password-hash-cost')
+    @click.argument('methods', nargs=-1)
+    @click.option('--rounds', type=int, default=5, show_default=True)
+    def password_hash_cost_command(methods, rounds):
+        """Time one password check for PASSWORD_HASH_METHOD (or the given methods) to tune login latency."""
+        from werkzeug.security import check_password_hash, generate_password_hash
+
+        for method in methods or (app.config['PASSWORD_HASH_METHOD'],):
+            try:
+                hashed = generate_password_hash('benchmark', method=method)
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint='methods')
+            started = time.perf_counter()
+            for _ in range(rounds):
+                check_password_hash(hashed, 'benchmark')
+            elapsed = (time.perf_counter() - started) / rounds * 1000
+            click.echo(f"{hashed.split('$', 1)[0]}: 每次验证 {elapsed:.1f} ms")
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Write content-hashed, pre-compressed copies of static/ to static/dist; restart the app afterwards."""
+        for asset in assets.build(app.static_folder, app.static_url_path):
+            compressed = ''.join(f', {coding} {size}' for coding, size in asset.compressed.items())
+            click.echo(f'{asset.source} -> {asset.target}: {asset.source_size} -> {asset.size} 字节{compressed}')
+
+    @app.cli.command('load-dumps')
+    @click.option('--directory', default=bootstrap.DUMP_DIR, show_default=True)
+    @click.option('--workers', type=int, default=4, show_default=True, help='并行加载的连接数')
+    @click.option('--force', is_flag=True, help='忽略已加载记录和已有数据，重新导入（会删除同名表）')
+    def load_dumps_command(directory, workers, force):
+        """Load the SQL dumps in dependency order, skipping files already loaded.
+
+        Refuses to run against a migrated database or over tables the dumps
+        did not create, since every dump drops its table first.
+        """
+        try:
+            results = bootstrap.load_dumps(db.engine, directory, workers=workers, force=force)
+        except bootstrap.DumpConflict as e:
+            raise click.ClickException(str(e))
+        for r in results:
+            if r.skipped:
+                click.echo(f'{r.filename}: 已加载，跳过')
+            else:
+                click.echo(f'{r.filename}: {r.rows} 行, {r.seconds:.2f}s, {r.rows_per_second:.0f} 行/秒')
+        click.echo(bootstrap.summary(results))
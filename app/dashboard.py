@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event, func, select
+
+from . import analytics, db, financials, reorder
+from .models import Medicine, Financial, MonthlyFinancial
+
+TOP_SELLERS = 5
+ZERO = Decimal('0.00')
+
+
+def _totals(row):
+    sales = financials.to_money(row.total_sales if row else 0)
+    returns = financials.to_money(row.total_returns if row else 0)
+    return {'sales': sales, 'returns': returns, 'net': sales - returns}
+
+
+def compute(app):
+    """Read every KPI from the rollup tables; runs on the refresh thread, not per request."""
+    today = date.today()
+    day = db.session.execute(select(Financial).where(Financial.date == today)).scalar()
+    month = db.session.execute(
+        select(MonthlyFinancial).where(MonthlyFinancial.month == financials.month_start(today))).scalar()
+    stock_value = db.session.execute(select(func.sum(Medicine.stock * Medicine.price))).scalar()
+    low_stock = reorder.suggestions(days_of_cover=app.config['REORDER_DAYS_OF_COVER'],
+                                    target_days=app.config['REORDER_TARGET_DAYS'], today=today)
+    return {
+        'day': today,
+        'refreshed_at': datetime.now(),
+        'today': _totals(day),
+        'month': _totals(month),
+        'stock_value': financials.to_money(stock_value),
+        'low_stock': len(low_stock),
+        'top_sellers': analytics.top_medicines(today - timedelta(days=6), today, limit=TOP_SELLERS),
+    }
+
+
+class KpiCache:
+    """KPIs kept in memory and refreshed by a daemon thread every ``interval`` seconds.
+
+    Readers always get the last snapshot without touching the database; once
+    it is older than ``2 * interval`` a read wakes the thread (stale-while-revalidate).
+    Committed sales and returns are applied to the in-memory counters at once.
+    """
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self.app = None
+        self._data = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def get(self):
+        self._ensure_thread()
+        data = self._data
+        if data is None:
+            return self.refresh()
+        if time.monotonic() - self._loaded_at > self.interval * 2 or data['day'] != date.today():
+            self._wake.set()
+        return data
+
+    def refresh(self):
+        with self.app.app_context():
+            data = compute(self.app)
+        with self._lock:
+            self._data = data
+            self._loaded_at = time.monotonic()
+        return data
+
+    def apply(self, changes):
+        """Add committed ``(day, sales, returns, stock_value)`` deltas to the current snapshot."""
+        with self._lock:
+            if self._data is None:
+                return
+            # 复制后整体替换，读者不会看到改了一半的字典
+            data = dict(self._data, today=dict(self._data['today']), month=dict(self._data['month']))
+            for day, sales, returns, stock_value in changes:
+                data['stock_value'] += stock_value
+                scopes = []
+                if day == data['day']:
+                    scopes.append(data['today'])
+                if financials.month_start(day) == financials.month_start(data['day']):
+                    scopes.append(data['month'])
+                for totals in scopes:
+                    totals['sales'] += sales
+                    totals['returns'] += returns
+                    totals['net'] += sales - returns
+            self._data = data
+
+    def _ensure_thread(self):
+        # 按进程启动；多进程服务器 fork 之后每个 worker 各有一个刷新线程
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='dashboard-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception:
+                self.app.logger.exception('Dashboard refresh failed')
+
+
+kpis = KpiCache()
+
+
+def bump(day, sales=ZERO, returns=ZERO, stock_value=ZERO):
+    """Queue a KPI change on the session; it reaches the dashboard only if the transaction commits."""
+    db.session.info.setdefault('dashboard_changes', []).append(
+        (day, financials.to_money(sales), financials.to_money(returns), financials.to_money(stock_value)))
+
+
+def _after_commit(session):
+    changes = session.info.pop('dashboard_changes', None)
+    if changes:
+        kpis.apply(changes)
+
+
+def _after_rollback(session):
+    session.info.pop('dashboard_changes', None)
+
+
+def init_app(app, session):
+    kpis.app = app
+    kpis.interval = app.config.get('DASHBOARD_REFRESH_SECONDS', kpis.interval)
+    if not event.contains(session, 'after_commit', _after_commit):
+        event.listen(session, 'after_commit', _after_commit)
+        event.listen(session, 'after_rollback', _after_rollback)
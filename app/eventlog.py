@@ -0,0 +1,147 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, has_request_context, request, session
+from flask.logging import default_handler
+
+# 记录上这些属性会原样写入 JSON
+CONTEXT_FIELDS = ('event', 'request_id', 'user', 'duration_ms')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``time`` and ``level`` come first so the log viewer can parse them."""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        data.update(getattr(record, 'fields', None) or {})
+        if record.levelno >= logging.WARNING:
+            data['source'] = f'{record.pathname}:{record.lineno}'
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach request ID, user and elapsed time while still on the request thread."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.user = session.get('username')
+            started = g.get('request_started')
+            if started is not None and getattr(record, 'duration_ms', None) is None:
+                record.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of high-frequency events; warnings and errors are never dropped."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None), 1.0)
+        return record.levelno >= logging.WARNING or rate >= 1.0 or random.random() < rate
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # 只在请求线程里合并参数、展开异常（traceback 对象不能跨线程保留），JSON 格式化交给监听线程
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def log_event(event, message=None, level=logging.INFO, **fields):
+    """Log a business event such as ``sale`` or ``login`` with structured fields."""
+    current_app.logger.log(level, message or event, extra={'event': event, 'fields': fields}, stacklevel=2)
+
+
+def init_app(app):
+    @app.before_request
+    def start_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        if request.endpoint != 'static':
+            log_event('request', f'{request.method} {request.path} {response.status_code}',
+                      method=request.method, path=request.path, status=response.status_code)
+        return response
+
+    if app.debug:
+        return
+
+    log_dir = os.path.dirname(app.config['LOG_FILE'])
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=app.config['LOG_MAX_BYTES'],
+                                  backupCount=app.config['LOG_BACKUP_COUNT'], encoding='utf-8')
+    handler.setFormatter(JsonFormatter())
+    listener = QueueListener(queue.SimpleQueue(), handler, respect_handler_level=True)
+    queue_handler = _QueueHandler(listener.queue)
+    queue_handler.listener = listener
+    queue_handler.setLevel(logging.INFO)
+    queue_handler.addFilter(RequestContextFilter())
+
+    # 同名 logger 在多次 create_app 之间共享，先摘掉旧的队列 handler 和采样过滤器
+    for old in [h for h in app.logger.handlers if isinstance(h, _QueueHandler)]:
+        app.logger.removeHandler(old)
+        old.listener.stop()
+    for old in [f for f in app.logger.filters if isinstance(f, SamplingFilter)]:
+        app.logger.removeFilter(old)
+    # Flask 默认的 stderr handler 会在请求线程里同步写每条日志，全部改走队列
+    app.logger.removeHandler(default_handler)
+    # 采样放在 logger 上，丢弃的记录不会到达任何 handler
+    app.logger.addFilter(SamplingFilter(app.config.get('LOG_SAMPLE_RATES', {})))
+    app.logger.addHandler(queue_handler)
+    app.logger.setLevel(logging.INFO)
+
+    listener.start()
+    atexit.register(listener.stop)
+    app.extensions['log_listener'] = listener
+
+
+def after_fork(app):
+    """Start a new writer thread in a forked worker; fork copies the queue but not the thread."""
+    listener = app.extensions.get('log_listener')
+    if listener is None:
+        return
+    fresh = QueueListener(listener.queue, *listener.handlers, respect_handler_level=True)
+    for handler in app.logger.handlers:
+        if isinstance(handler, _QueueHandler) and handler.listener is listener:
+            handler.listener = fresh
+    atexit.unregister(listener.stop)
+    fresh.start()
+    atexit.register(fresh.stop)
+    app.extensions['log_listener'] = fresh
@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from . import db
+from .models import Medicine, Customer, Supplier, Purchase, Sale, Return, Inventory
+
+CHUNK_SIZE = 1000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportSpec:
+    def __init__(self, build, date_column, filters):
+        self.build = build
+        self.date_column = date_column
+        self.filters = filters
+
+
+def _sales():
+    return select(
+        Sale.id, Sale.sale_date, Sale.medicine_id, Medicine.name.label('medicine'),
+        Sale.customer_id, Customer.name.label('customer'), Sale.quantity, Sale.unit_price, Sale.total_price,
+    ).join(Medicine, Sale.medicine_id == Medicine.id).outerjoin(Customer, Sale.customer_id == Customer.id)
+
+
+def _purchases():
+    return select(
+        Purchase.id, Purchase.purchase_date, Purchase.medicine_id, Medicine.name.label('medicine'),
+        Purchase.supplier_id, Supplier.name.label('supplier'), Purchase.quantity,
+    ).join(Medicine, Purchase.medicine_id == Medicine.id).outerjoin(Supplier, Purchase.supplier_id == Supplier.id)
+
+
+def _returns():
+    return select(
+        Return.id, Return.return_date, Return.sale_id, Sale.medicine_id, Medicine.name.label('medicine'),
+        Sale.customer_id, Customer.name.label('customer'), Return.quantity, Return.refund_amount,
+    ).join(Sale, Return.sale_id == Sale.id).join(Medicine, Sale.medicine_id == Medicine.id) \
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+
+
+def _inventory():
+    return select(
+        Inventory.id, Inventory.medicine_id, Medicine.name.label('medicine'), Inventory.quantity,
+        Inventory.last_updated,
+    ).join(Medicine, Inventory.medicine_id == Medicine.id)
+
+
+EXPORTS = {
+    'sales': ExportSpec(_sales, Sale.sale_date,
+                        {'medicine_id': Sale.medicine_id, 'customer_id': Sale.customer_id}),
+    'purchases': ExportSpec(_purchases, Purchase.purchase_date,
+                            {'medicine_id': Purchase.medicine_id, 'supplier_id': Purchase.supplier_id}),
+    'returns': ExportSpec(_returns, Return.return_date,
+                          {'medicine_id': Sale.medicine_id, 'customer_id': Sale.customer_id}),
+    'inventory': ExportSpec(_inventory, Inventory.last_updated,
+                            {'medicine_id': Inventory.medicine_id}),
+}
+
+
+def build_query(name, start=None, end=None, **filters):
+    spec = EXPORTS[name]
+    stmt = spec.build()
+    # 过滤条件全部下推到 SQL，按主键顺序输出
+    if start:
+        stmt = stmt.where(spec.date_column >= start)
+    if end:
+        stmt = stmt.where(spec.date_column <= end)
+    for key, value in filters.items():
+        if value is not None:
+            if key not in spec.filters:
+                raise ValueError(f'{name} 不支持按 {key} 过滤')
+            stmt = stmt.where(spec.filters[key] == value)
+    primary_key = stmt.selected_columns[0]
+    return stmt.order_by(primary_key).execution_options(yield_per=CHUNK_SIZE)
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunk(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows([[_plain(v) for v in row] for row in rows])
+    return buffer.getvalue()
+
+
+def _ndjson_chunk(keys, rows):
+    return ''.join(json.dumps(dict(zip(keys, map(_plain, row))), ensure_ascii=False) + '\n' for row in rows)
+
+
+def stream_rows(stmt, fmt):
+    """Yield the export as text chunks, one per server-side cursor batch."""
+    result = db.session.execute(stmt)
+    try:
+        keys = list(result.keys())
+        if fmt == 'csv':
+            yield _csv_chunk([], header=keys)
+        for rows in result.partitions():
+            if fmt == 'csv':
+                yield _csv_chunk(rows)
+            else:
+                yield _ndjson_chunk(keys, rows)
+    finally:
+        result.close()
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Sale, Return, Financial, MonthlyFinancial
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def to_money(value):
+    return Decimal(value or 0).quantize(CENT)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def returned_quantity(sale_id):
+    return db.session.query(func.coalesce(func.sum(Return.quantity), 0)) \
+        .filter(Return.sale_id == sale_id).scalar()
+
+
+def return_value(sale, quantity):
+    if sale.unit_price is not None:
+        return to_money(Decimal(sale.unit_price) * quantity)
+    # 旧数据没有成交单价：sale.quantity 在退货后会被扣减，按原始销售数量 (剩余 + 已退) 折算
+    original_quantity = sale.quantity + returned_quantity(sale.id)
+    if not original_quantity:
+        return ZERO
+    return to_money(Decimal(sale.total_price or 0) * quantity / original_quantity)
+
+
+def _bump(model, key_column, key, sales, returns):
+    delta = {
+        'total_sales': func.coalesce(model.total_sales, 0) + sales,
+        'total_returns': func.coalesce(model.total_returns, 0) + returns,
+        'net_profit': func.coalesce(model.net_profit, 0) + sales - returns,
+    }
+    stmt = update(model).where(key_column == key).values(**delta) \
+        .execution_options(synchronize_session=False)
+    if db.session.execute(stmt).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**{key_column.key: key}, total_sales=sales, total_returns=returns,
+                                 total_purchases=ZERO, net_profit=sales - returns))
+    except IntegrityError:
+        # 并发请求先插入了同一天/同一月的行，改为累加
+        db.session.execute(stmt)
+
+
+def record(day, sales=ZERO, returns=ZERO):
+    """Apply a sale/return delta to the daily and monthly rollups; the caller commits."""
+    sales, returns = to_money(sales), to_money(returns)
+    _bump(Financial, Financial.date, day, sales, returns)
+    _bump(MonthlyFinancial, MonthlyFinancial.month, month_start(day), sales, returns)
+
+
+def _unpriced_sales():
+    returned = select(func.coalesce(func.sum(Return.quantity), 0)).where(Return.sale_id == Sale.id).scalar_subquery()
+    original_quantity = Sale.quantity + returned
+    return original_quantity, (Sale.unit_price.is_(None), Sale.total_price.isnot(None), original_quantity > 0)
+
+
+def missing_prices():
+    """Count the sales and returns :func:`backfill_prices` would fill in, without changing them."""
+    _, unpriced = _unpriced_sales()
+    sales = db.session.scalar(select(func.count()).select_from(Sale).where(*unpriced))
+    returns = db.session.scalar(select(func.count()).select_from(Return).where(Return.refund_amount.is_(None)))
+    return sales, returns
+
+
+def backfill_prices():
+    """Fill in ``sales.unit_price`` and ``returns.refund_amount`` where they are missing (e.g. rows loaded from dumps)."""
+    original_quantity, unpriced = _unpriced_sales()
+    sales = db.session.execute(
+        update(Sale).where(*unpriced)
+        .values(unit_price=func.round(Sale.total_price * 1.0 / original_quantity, 2))
+        .execution_options(synchronize_session=False)).rowcount
+    unit_price = select(Sale.unit_price).where(Sale.id == Return.sale_id).scalar_subquery()
+    returns = db.session.execute(
+        update(Return).where(Return.refund_amount.is_(None))
+        .values(refund_amount=func.round(Return.quantity * unit_price, 2))
+        .execution_options(synchronize_session=False)).rowcount
+    return sales, returns
+
+
+def compute_daily():
+    """Recompute per-day totals as plain SUMs over ``sales.total_price`` and ``returns.refund_amount``."""
+    totals = defaultdict(lambda: [ZERO, ZERO])
+    for day, amount in db.session.execute(
+            select(Sale.sale_date, func.sum(Sale.total_price)).group_by(Sale.sale_date)):
+        totals[day][0] = to_money(amount)
+    for day, amount in db.session.execute(
+            select(Return.return_date, func.sum(Return.refund_amount)).group_by(Return.return_date)):
+        totals[day][1] = to_money(amount)
+    return totals
+
+
+def rebuild(repair=True):
+    """Compare the rollups with a from-scratch recomputation.
+
+    Returns a list of ``(kind, key, stored, expected)`` drift entries, where
+    stored/expected are ``(sales, returns)`` tuples. With ``repair`` missing
+    prices are backfilled first and the rollup rows are rewritten to the
+    expected values and committed; without it nothing is written, and returns
+    still missing a refund amount count as zero (see :func:`missing_prices`).
+    """
+    if repair:
+        backfill_prices()
+    daily = compute_daily()
+    monthly = defaultdict(lambda: [ZERO, ZERO])
+    for day, (sales, returns) in daily.items():
+        monthly[month_start(day)][0] += sales
+        monthly[month_start(day)][1] += returns
+
+    drift = []
+    for kind, model, key_column, expected in (('daily', Financial, Financial.date, daily),
+                                              ('monthly', MonthlyFinancial, MonthlyFinancial.month, monthly)):
+        stored = {getattr(row, key_column.key): row for row in model.query}
+        for key in sorted(set(stored) | set(expected)):
+            want = tuple(expected.get(key, (ZERO, ZERO)))
+            row = stored.get(key)
+            have = (to_money(row.total_sales), to_money(row.total_returns)) if row else (ZERO, ZERO)
+            if have == want and (row is None or to_money(row.net_profit) == want[0] - want[1]):
+                continue
+            drift.append((kind, key, have, want))
+            if repair:
+                if row is None:
+                    row = model(**{key_column.key: key}, total_purchases=ZERO)
+                    db.session.add(row)
+                row.total_sales, row.total_returns = want
+                row.net_profit = want[0] - want[1]
+    if repair:
+        db.session.commit()
+    return drift
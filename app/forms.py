@@ -1,6 +1,33 @@
+from flask import url_for
+from markupsafe import Markup
 from flask_wtf import FlaskForm
-from wtforms import StringField, DecimalField, IntegerField, DateField, SubmitField, SelectField, PasswordField, BooleanField
-from wtforms.validators import DataRequired, Length, NumberRange, EqualTo
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import Form, FieldList, FormField, StringField, DecimalField, IntegerField, DateField, SubmitField, SelectField, PasswordField, BooleanField
+from wtforms.validators import DataRequired, Length, NumberRange, EqualTo, Optional
+from wtforms.widgets import html_params
+
+class TypeaheadWidget:
+    def __call__(self, field, **kwargs):
+        text = html_params(type='text', id=f'{field.id}_label', name=f'{field.name}_label', value=field.display,
+                           list=f'{field.id}_options', autocomplete='off', placeholder='输入名称搜索',
+                           **{'class': 'typeahead', 'data-source': url_for(field.source), 'data-target': field.id})
+        hidden = html_params(type='hidden', id=field.id, name=field.name,
+                             value=field.data if field.data is not None else '')
+        return Markup(f'<input {text}><datalist id="{field.id}_options"></datalist><input {hidden}>')
+
+class TypeaheadField(IntegerField):
+    """An id field picked through a JSON search endpoint instead of a full <select>."""
+    widget = TypeaheadWidget()
+
+    def __init__(self, label=None, validators=None, source=None, **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self.source = source
+        self.display = ''
+
+    def process(self, formdata, *args, **kwargs):
+        super().process(formdata, *args, **kwargs)
+        if formdata is not None:
+            self.display = formdata.get(f'{self.name}_label', '')
 
 class MedicineForm(FlaskForm):
     name = StringField('名称', validators=[DataRequired(), Length(max=255)])
@@ -29,25 +56,51 @@ class SupplierForm(FlaskForm):
     submit = SubmitField('添加供应商')
 
 class PurchaseForm(FlaskForm):
-    medicine_id = SelectField('药品', coerce=int, validators=[DataRequired()])
+    medicine_id = TypeaheadField('药品', validators=[DataRequired()], source='search_medicines')
     quantity = IntegerField('数量', validators=[DataRequired(), NumberRange(min=1)])
     purchase_date = DateField('采购日期', format='%Y-%m-%d', validators=[DataRequired()])
     supplier_id = SelectField('供应商', coerce=int, validators=[DataRequired()])
     submit = SubmitField('添加采购')
 
 class ReturnForm(FlaskForm):
-    sale_id = SelectField('销售', coerce=int, validators=[DataRequired()])
+    sale_id = TypeaheadField('销售', validators=[DataRequired()], source='search_sales')
     quantity = IntegerField('数量', validators=[DataRequired(), NumberRange(min=1)])
     return_date = DateField('退货日期', format='%Y-%m-%d', validators=[DataRequired()])
     submit = SubmitField('处理退货')
 
 class SaleForm(FlaskForm):
-    medicine_id = SelectField('药品', coerce=int, validators=[DataRequired()])
-    customer_id = SelectField('客户', coerce=int, validators=[DataRequired()])
+    medicine_id = TypeaheadField('药品', validators=[DataRequired()], source='search_medicines')
+    customer_id = TypeaheadField('客户', validators=[DataRequired()], source='search_customers')
     quantity = IntegerField('数量', validators=[DataRequired(), NumberRange(min=1)])
     sale_date = DateField('销售日期', format='%Y-%m-%d', validators=[DataRequired()])
     submit = SubmitField('添加销售')
 
+class LineItemForm(Form):
+    medicine_id = TypeaheadField('药品', validators=[Optional()], source='search_medicines')
+    quantity = IntegerField('数量', validators=[Optional(), NumberRange(min=1)])
+
+    def validate(self, extra_validators=None):
+        # 空行跳过；只填了药品或只填了数量的行必须报错，不能在结账时被悄悄丢掉
+        valid = super().validate(extra_validators)
+        if self.medicine_id.data and self.quantity.data is None:
+            self.quantity.errors.append('请填写数量。')
+            valid = False
+        if self.quantity.data and not self.medicine_id.data:
+            self.medicine_id.errors.append('请选择药品。')
+            valid = False
+        return valid
+
+class CheckoutForm(FlaskForm):
+    customer_id = TypeaheadField('客户', validators=[DataRequired()], source='search_customers')
+    sale_date = DateField('销售日期', format='%Y-%m-%d', validators=[DataRequired()])
+    items = FieldList(FormField(LineItemForm), min_entries=8, max_entries=50)
+    submit = SubmitField('结账')
+
+class ImportForm(FlaskForm):
+    kind = SelectField('数据类型', choices=[('medicines', '药品'), ('purchases', '采购'), ('customers', '客户')])
+    file = FileField('CSV 文件', validators=[FileRequired(), FileAllowed(['csv'], '只支持 CSV 文件')])
+    submit = SubmitField('导入')
+
 class UserForm(FlaskForm):
     username = StringField('用户名', validators=[DataRequired(), Length(min=3, max=150)])
     password = PasswordField('密码', validators=[DataRequired(), Length(min=6)])
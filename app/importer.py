@@ -0,0 +1,202 @@
+import csv
+from datetime import date
+
+from sqlalchemy import exists, insert, literal, select
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+
+from . import db, ledger
+from .forms import MedicineForm, CustomerForm, PurchaseForm
+from .models import Medicine, Customer, Supplier, Purchase, Inventory
+from .services import add_stock, adjust_inventory_many
+
+CHUNK_SIZE = 500
+
+
+class ImportResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.imported = 0
+        self.errors = []  # [(行号, 错误信息)]
+
+    def fail(self, line, message):
+        self.errors.append((line, message))
+
+
+def _form_errors(form):
+    return '; '.join(f'{name}: {", ".join(errors)}' for name, errors in form.errors.items())
+
+
+def _optional_id(row):
+    value = (row.get('id') or '').strip()
+    return int(value) if value else None
+
+
+def _upsert(model, rows, update_columns):
+    """Insert ``rows`` keyed by primary key, updating ``update_columns`` on conflict."""
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.id],
+                                          set_={c: stmt.excluded[c] for c in update_columns})
+    else:
+        raise NotImplementedError(f'不支持的数据库: {dialect}')
+    db.session.execute(stmt, rows)
+
+
+def _ensure_inventory(medicine_ids):
+    # 为还没有库存记录的药品按当前 stock 建一行
+    missing = ~exists().where(Inventory.medicine_id == Medicine.id)
+    db.session.execute(insert(Inventory).from_select(
+        ['medicine_id', 'quantity', 'last_updated'],
+        select(Medicine.id, Medicine.stock, literal(date.today())).where(Medicine.id.in_(medicine_ids), missing)))
+
+
+def _parse_medicine(row):
+    form = MedicineForm(formdata=MultiDict(row), meta={'csrf': False})
+    if not form.validate():
+        raise ValueError(_form_errors(form))
+    supplier_id = (row.get('supplier_id') or '').strip()
+    return {
+        'id': _optional_id(row),
+        'name': form.name.data,
+        'description': form.description.data,
+        'price': form.price.data,
+        'stock': form.stock.data,
+        'opening_stock': form.stock.data,  # 只在新建时写入，已存在的药品不会更新它
+        'supplier_id': int(supplier_id) if supplier_id else None,
+    }
+
+
+def _write_medicines(rows):
+    keyed = [r for r in rows if r['id'] is not None]
+    opening = {}
+    if keyed:
+        # 带 id 但尚不存在的行会被插入，同样要记初始库存；同一 id 出现多次时以首次插入的行为准
+        existing = set(db.session.scalars(select(Medicine.id).where(Medicine.id.in_({r['id'] for r in keyed}))))
+        for r in keyed:
+            if r['id'] not in existing:
+                opening.setdefault(r['id'], r['stock'])
+        # 已存在的药品只更新目录字段，库存由采购/销售维护
+        _upsert(Medicine, keyed, ['name', 'description', 'price', 'supplier_id'])
+    new = [Medicine(**{k: v for k, v in r.items() if k != 'id'}) for r in rows if r['id'] is None]
+    db.session.add_all(new)
+    db.session.flush()
+    opening.update((m.id, m.stock) for m in new)
+    _ensure_inventory([r['id'] for r in keyed] + [m.id for m in new])
+    ledger.record([(medicine_id, stock, 'opening', date.today(), None) for medicine_id, stock in opening.items()])
+
+
+def _parse_customer(row):
+    form = CustomerForm(formdata=MultiDict(row), meta={'csrf': False})
+    if not form.validate():
+        raise ValueError(_form_errors(form))
+    return {
+        'id': _optional_id(row),
+        'name': form.name.data,
+        'contact_info': form.contact_info.data,
+        'address': form.address.data,
+    }
+
+
+def _write_customers(rows):
+    keyed = [r for r in rows if r['id'] is not None]
+    if keyed:
+        _upsert(Customer, keyed, ['name', 'contact_info', 'address'])
+    new = [{k: v for k, v in r.items() if k != 'id'} for r in rows if r['id'] is None]
+    if new:
+        db.session.execute(insert(Customer), new)
+
+
+def _parse_purchase(row):
+    form = PurchaseForm(formdata=MultiDict(row), meta={'csrf': False})
+    # 供应商是否存在按块批量校验，不在这里加载全部选项
+    form.supplier_id.validate_choice = False
+    if not form.validate():
+        raise ValueError(_form_errors(form))
+    return {
+        'medicine_id': form.medicine_id.data,
+        'supplier_id': form.supplier_id.data,
+        'quantity': form.quantity.data,
+        'purchase_date': form.purchase_date.data,
+    }
+
+
+def _check_purchases(chunk, result):
+    medicine_ids = {row['medicine_id'] for _, row in chunk}
+    supplier_ids = {row['supplier_id'] for _, row in chunk}
+    known_medicines = set(db.session.scalars(select(Medicine.id).where(Medicine.id.in_(medicine_ids))))
+    known_suppliers = set(db.session.scalars(select(Supplier.id).where(Supplier.id.in_(supplier_ids))))
+    valid = []
+    for line, row in chunk:
+        if row['medicine_id'] not in known_medicines:
+            result.fail(line, f'药品 {row["medicine_id"]} 不存在')
+        elif row['supplier_id'] not in known_suppliers:
+            result.fail(line, f'供应商 {row["supplier_id"]} 不存在')
+        else:
+            valid.append((line, row))
+    return valid
+
+
+def _write_purchases(rows):
+    db.session.execute(insert(Purchase), rows)
+    quantities = {}
+    for row in rows:
+        quantities[row['medicine_id']] = quantities.get(row['medicine_id'], 0) + row['quantity']
+    add_stock(quantities)
+    adjust_inventory_many(quantities)
+    ledger.record([(row['medicine_id'], row['quantity'], 'purchase', row['purchase_date'], None) for row in rows])
+
+
+IMPORTERS = {
+    'medicines': (_parse_medicine, None, _write_medicines),
+    'customers': (_parse_customer, None, _write_customers),
+    'purchases': (_parse_purchase, _check_purchases, _write_purchases),
+}
+
+
+def _flush_chunk(kind, chunk, result):
+    _, check, write = IMPORTERS[kind]
+    if check:
+        chunk = check(chunk, result)
+    if not chunk:
+        return
+    try:
+        write([row for _, row in chunk])
+        db.session.commit()
+        result.imported += len(chunk)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        for line, _ in chunk:
+            result.fail(line, f'写入失败: {e.__class__.__name__}')
+
+
+def import_csv(kind, stream, chunk_size=CHUNK_SIZE):
+    """Validate and import a CSV text stream row by row, committing every ``chunk_size`` rows.
+
+    Invalid rows are recorded in the result and skipped; they never abort the batch.
+    """
+    parse = IMPORTERS[kind][0]
+    result = ImportResult(kind)
+    chunk = []
+    reader = csv.DictReader(stream)
+    for line, row in enumerate(reader, start=2):
+        try:
+            chunk.append((line, parse({k.strip(): (v or '') for k, v in row.items() if k})))
+        except ValueError as e:
+            result.fail(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _flush_chunk(kind, chunk, result)
+            chunk = []
+    _flush_chunk(kind, chunk, result)
+    return result
@@ -0,0 +1,102 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select, update
+
+from . import db
+from .models import StockMovement, StockSnapshot
+
+
+def record(movements):
+    """Append ``(medicine_id, delta, kind, movement_date, reference_id)`` tuples to the ledger.
+
+    Snapshots are only taken for past days, so a backdated movement also
+    shifts every snapshot taken on or after its date.
+    """
+    if not movements:
+        return
+    now = datetime.now()
+    db.session.execute(insert(StockMovement), [
+        {'medicine_id': medicine_id, 'delta': delta, 'kind': kind, 'movement_date': movement_date,
+         'reference_id': reference_id, 'created_at': now}
+        for medicine_id, delta, kind, movement_date, reference_id in movements
+    ])
+    backdated = [{'m_id': medicine_id, 'm_date': movement_date, 'm_delta': delta}
+                 for medicine_id, delta, _, movement_date, _ in movements if movement_date < date.today()]
+    if backdated:
+        db.session.execute(
+            update(StockSnapshot.__table__)
+            .where(StockSnapshot.medicine_id == bindparam('m_id'), StockSnapshot.snapshot_date >= bindparam('m_date'))
+            .values(quantity=StockSnapshot.quantity + bindparam('m_delta')),
+            backdated)
+
+
+def record_movement(medicine_id, delta, kind, movement_date, reference_id=None):
+    record([(medicine_id, delta, kind, movement_date, reference_id)])
+
+
+def _latest_snapshots(day, medicine_ids):
+    stmt = select(StockSnapshot.medicine_id, func.max(StockSnapshot.snapshot_date).label('snapshot_date')) \
+        .where(StockSnapshot.snapshot_date <= day).group_by(StockSnapshot.medicine_id)
+    if medicine_ids is not None:
+        stmt = stmt.where(StockSnapshot.medicine_id.in_(medicine_ids))
+    return stmt.subquery()
+
+
+def stock_on(day, medicine_ids=None):
+    """Stock at the end of ``day`` as ``{medicine_id: quantity}``.
+
+    Starts from each medicine's latest snapshot on or before ``day`` and adds
+    only the ledger rows after it, so the cost is bounded by the snapshot interval.
+    """
+    latest = _latest_snapshots(day, medicine_ids)
+    balances = defaultdict(int)
+    snapshots = select(StockSnapshot.medicine_id, StockSnapshot.quantity) \
+        .join(latest, and_(latest.c.medicine_id == StockSnapshot.medicine_id,
+                           latest.c.snapshot_date == StockSnapshot.snapshot_date))
+    for medicine_id, quantity in db.session.execute(snapshots):
+        balances[medicine_id] = quantity
+
+    movements = select(StockMovement.medicine_id, func.sum(StockMovement.delta)) \
+        .outerjoin(latest, latest.c.medicine_id == StockMovement.medicine_id) \
+        .where(StockMovement.movement_date <= day,
+               or_(latest.c.snapshot_date.is_(None), StockMovement.movement_date > latest.c.snapshot_date)) \
+        .group_by(StockMovement.medicine_id)
+    if medicine_ids is not None:
+        movements = movements.where(StockMovement.medicine_id.in_(medicine_ids))
+    for medicine_id, delta in db.session.execute(movements):
+        balances[medicine_id] += delta
+    return dict(balances)
+
+
+def stock_history(medicine_id, start, end):
+    """Daily closing stock of one medicine between ``start`` and ``end``: ``[(day, delta, balance)]``.
+
+    Only days with movements are listed; the balance carries over between them.
+    """
+    balance = stock_on(start - timedelta(days=1), [medicine_id]).get(medicine_id, 0)
+    history = []
+    for day, delta in db.session.execute(
+            select(StockMovement.movement_date, func.sum(StockMovement.delta))
+            .where(StockMovement.medicine_id == medicine_id,
+                   StockMovement.movement_date.between(start, end))
+            .group_by(StockMovement.movement_date).order_by(StockMovement.movement_date)):
+        balance += delta
+        history.append((day, delta, balance))
+    return history
+
+
+def take_snapshots(day=None):
+    """Store every medicine's closing stock for ``day`` (default yesterday); returns the number of rows."""
+    day = day or date.today() - timedelta(days=1)
+    if day >= date.today():
+        raise ValueError('只能为已经结束的日期生成快照。')
+    balances = stock_on(day)
+    db.session.execute(delete(StockSnapshot).where(StockSnapshot.snapshot_date == day))
+    if balances:
+        db.session.execute(insert(StockSnapshot), [
+            {'medicine_id': medicine_id, 'snapshot_date': day, 'quantity': quantity}
+            for medicine_id, quantity in balances.items()
+        ])
+    db.session.commit()
+    return len(balances)
@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import date
+
+from flask import request, abort
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class Page:
+    def __init__(self, items, next_cursor, per_page, cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        decoded = []
+        for column, value in zip(columns, values):
+            if column.type.python_type is date:
+                decoded.append(date.fromisoformat(value))
+            else:
+                decoded.append(column.type.python_type(value))
+        return decoded
+    except (ValueError, TypeError, NotImplementedError):
+        abort(400)
+
+
+def keyset_filter(columns, values):
+    # (a, b) < (x, y)  =>  a < x OR (a = x AND b < y)，展开写法便于走索引
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i]))
+    return or_(*clauses)
+
+
+def page_args():
+    cursor = request.args.get('cursor') or None
+    per_page = request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)
+    return cursor, max(1, min(per_page or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def paginate(query, order_by, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """Keyset pagination in descending ``order_by`` order; the last column must be unique (the id)."""
+    if cursor:
+        query = query.filter(keyset_filter(order_by, decode_cursor(cursor, order_by)))
+    rows = query.order_by(*[column.desc() for column in order_by]).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in order_by])
+    return Page(rows, next_cursor, per_page, cursor)
+
+
+def paginate_request(query, order_by):
+    cursor, per_page = page_args()
+    return paginate(query, order_by, cursor, per_page)
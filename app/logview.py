@@ -0,0 +1,226 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+BLOCK_SIZE = 64 * 1024
+DEFAULT_LINES = 200
+MAX_LINES = 1000
+LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+# 旧的文本格式: '%(asctime)s %(levelname)s: %(message)s'；新的 JSON 行见 _parse_header
+HEADER = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} ([A-Z]+)')
+
+
+class LogRecord:
+    def __init__(self, text, timestamp=None, level=None):
+        self.text = text
+        self.timestamp = timestamp
+        self.level = level
+
+
+def log_files(path):
+    """The live log first, then its rotated backups ``.1``, ``.2`` ... (newest to oldest)."""
+    backups = []
+    for name in glob.glob(glob.escape(path) + '.*'):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), name))
+    files = [path] if os.path.exists(path) else []
+    return files + [name for _, name in sorted(backups)]
+
+
+def reverse_lines(f, end, block_size=BLOCK_SIZE):
+    """Yield ``(offset, line)`` pairs from byte ``end`` towards the start of the file."""
+    pos, tail = end, b''
+    while pos > 0:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        lines = (f.read(size) + tail).split(b'\n')
+        tail = lines.pop(0)  # 可能是被块边界截断的行，留到下一块拼接
+        offset = pos + len(tail) + 1
+        located = []
+        for line in lines:
+            located.append((offset, line))
+            offset += len(line) + 1
+        yield from reversed(located)
+    yield 0, tail
+
+
+def _parse_header(line):
+    if line.startswith(b'{'):
+        # eventlog.JsonFormatter 写出的 JSON 行
+        try:
+            data = json.loads(line)
+            return datetime.fromisoformat(data['time']).replace(microsecond=0), data['level']
+        except (ValueError, KeyError, TypeError):
+            return None
+    m = HEADER.match(line)
+    if not m:
+        return None
+    return datetime.strptime(m.group(1).decode(), '%Y-%m-%d %H:%M:%S'), m.group(2).decode()
+
+
+def reverse_records(f, end, block_size=BLOCK_SIZE):
+    """Group lines into records (a header line plus continuation lines such as tracebacks), newest first."""
+    pending = []
+    for offset, line in reverse_lines(f, end, block_size):
+        if not line.strip():
+            continue
+        header = _parse_header(line)
+        if header is None:
+            pending.append(line)
+            continue
+        text = b'\n'.join([line] + pending[::-1]).decode('utf-8', errors='replace')
+        pending = []
+        yield offset, LogRecord(text, *header)
+    if pending:
+        yield 0, LogRecord(b'\n'.join(pending[::-1]).decode('utf-8', errors='replace'))
+
+
+def _stat(path):
+    # 列出文件和读取之间可能发生轮转，最老的备份会被删掉；这种文件当作不存在
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def encode_cursor(inode, offset):
+    return f'{inode}:{offset}'
+
+
+def _locate(cursor, files):
+    # 游标里记的是 inode，日志轮转改名后仍能找到同一个文件
+    inode, offset = (int(part) for part in cursor.split(':'))
+    for index, path in enumerate(files):
+        st = _stat(path)
+        if st is None or st.st_ino != inode:
+            continue
+        if st.st_size >= offset:
+            return index, offset
+        # 文件比游标短：被 logrotate copytruncate 清空过，原内容已复制到下一个备份
+        older = _stat(files[index + 1]) if index + 1 < len(files) else None
+        if older is not None and older.st_size >= offset:
+            return index + 1, offset
+        break
+    return None, None
+
+
+def tail(path, lines=DEFAULT_LINES, level=None, start=None, end=None, cursor=None):
+    """Return ``(records, next_cursor)`` for the newest matching records older than ``cursor``.
+
+    Records are read backwards in blocks across the live log and its rotated
+    backups, so only the part of the files that is shown is ever read.
+    """
+    files = log_files(path)
+    index, offset = 0, None
+    if cursor:
+        index, offset = _locate(cursor, files)
+        if index is None:
+            return [], None
+    min_level = LEVELS.index(level) if level in LEVELS else 0
+
+    records = []
+    for file_index in range(index, len(files)):
+        try:
+            f = open(files[file_index], 'rb')
+        except FileNotFoundError:
+            offset = None  # 已被轮转删除，跳到更早的文件
+            continue
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            file_end = os.fstat(f.fileno()).st_size if offset is None else offset
+            offset = None
+            for record_offset, record in reverse_records(f, file_end):
+                if start and record.timestamp and record.timestamp < start:
+                    return records, None  # 更早的记录都在时间窗口之外
+                if end and record.timestamp and record.timestamp > end:
+                    continue
+                if record.level in LEVELS and LEVELS.index(record.level) < min_level:
+                    continue
+                records.append(record)
+                if len(records) >= lines:
+                    if record_offset > 0:
+                        return records, encode_cursor(inode, record_offset)
+                    older = next(filter(None, map(_stat, files[file_index + 1:])), None)
+                    if older is not None:
+                        return records, encode_cursor(older.st_ino, older.st_size)
+                    return records, None
+    return records, None
+
+
+class StreamSlots:
+    """Cap concurrent live-tail streams per process; each one holds a server thread for its whole lifetime."""
+
+    def __init__(self, limit=1):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+streams = StreamSlots()
+
+
+def follow(path, level=None, poll=1.0, timeout=300, keepalive=15):
+    """Yield server-sent events for lines appended to ``path``, reopening it after rotation
+    and starting over from the top after it is truncated in place.
+
+    The stream ends after ``timeout`` seconds; EventSource reconnects on its own.
+    """
+    min_level = LEVELS.index(level) if level in LEVELS else 0
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    f, inode, buffer, first = None, None, b'', True
+    try:
+        while time.monotonic() < deadline:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    pass  # 轮转后新文件还没创建，下一轮再试
+                else:
+                    inode = os.fstat(f.fileno()).st_ino
+                    if first:
+                        f.seek(0, os.SEEK_END)  # 首次连接只推送新日志
+                        first = False
+            if f is not None:
+                if os.fstat(f.fileno()).st_size < f.tell():
+                    f.seek(0)  # copytruncate 清空了文件，新日志从头写入
+                    buffer = b''
+                chunk = f.read()
+                if chunk:
+                    *complete, buffer = (buffer + chunk).split(b'\n')
+                    for line in complete:
+                        header = _parse_header(line)
+                        if not line.strip() or (header and header[1] in LEVELS
+                                                and LEVELS.index(header[1]) < min_level):
+                            continue
+                        last_sent = time.monotonic()
+                        yield f"data: {line.decode('utf-8', errors='replace')}\n\n"
+                elif getattr(_stat(path), 'st_ino', None) != inode:
+                    f.close()
+                    f, buffer = None, b''  # 文件已轮转，从头读取新的日志文件
+                    continue
+            if time.monotonic() - last_sent >= keepalive:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+            time.sleep(poll)
+    finally:
+        if f is not None:
+            f.close()
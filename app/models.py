@@ -1,13 +1,17 @@
+import functools
+
+from flask import current_app
 from . import db
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class Medicine(db.Model):
     __tablename__ = 'medicines'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     description = db.Column(db.Text)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     stock = db.Column(db.Integer, nullable=False)
+    opening_stock = db.Column(db.Integer)  # 建档时的初始库存，库存核对的起点
     supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'))
 
 class Supplier(db.Model):
@@ -28,7 +32,7 @@ class Employee(db.Model):
 class Customer(db.Model):
     __tablename__ = 'customers'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), nullable=False)
+    name = db.Column(db.String(255), nullable=False, index=True)
     contact_info = db.Column(db.String(255))
     address = db.Column(db.Text)
 
@@ -40,20 +44,42 @@ class Purchase(db.Model):
     purchase_date = db.Column(db.Date, nullable=False)
     supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'))
 
+    __table_args__ = (
+        db.Index('ix_purchases_purchase_date_medicine_id', 'purchase_date', 'medicine_id'),
+        db.Index('ix_purchases_medicine_id_quantity', 'medicine_id', 'quantity'),
+    )
+
     medicine = db.relationship('Medicine', backref='purchases')
     supplier = db.relationship('Supplier', backref='purchases')
 
+class Order(db.Model):
+    __tablename__ = 'orders'
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
+    order_date = db.Column(db.Date, nullable=False)
+    total_price = db.Column(db.Numeric(12, 2))
+
+    customer = db.relationship('Customer', backref='orders')
+
 class Sale(db.Model):
     __tablename__ = 'sales'
     id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), index=True)  # 整单结账的明细行
     medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
-    quantity = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)  # 退货后会扣减
     sale_date = db.Column(db.Date, nullable=False)
-    total_price = db.Column(db.Numeric(10, 2))
+    unit_price = db.Column(db.Numeric(10, 2))  # 成交单价，不随药品调价变化
+    total_price = db.Column(db.Numeric(10, 2))  # 原始成交总价，退货不扣减
+
+    __table_args__ = (
+        db.Index('ix_sales_sale_date_medicine_id', 'sale_date', 'medicine_id'),
+        db.Index('ix_sales_medicine_id_quantity', 'medicine_id', 'quantity'),
+    )
 
     medicine = db.relationship('Medicine', backref='sales')
     customer = db.relationship('Customer', backref='sales')
+    order = db.relationship('Order', backref='items')
 
 class Return(db.Model):
     __tablename__ = 'returns'
@@ -61,17 +87,69 @@ class Return(db.Model):
     sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
     return_date = db.Column(db.Date, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
+    refund_amount = db.Column(db.Numeric(10, 2))  # 按成交单价计算的退款额
+
+    __table_args__ = (
+        db.Index('ix_returns_return_date_sale_id', 'return_date', 'sale_id'),
+    )
 
     sale = db.relationship('Sale', backref='returns')
 
+class MedicineDailySales(db.Model):  # 每个药品每天的净销量（已扣除退货），用于计算销售速度
+    __tablename__ = 'medicine_sales_daily'
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('medicine_id', 'day', name='uq_medicine_sales_daily_medicine_id_day'),
+        db.Index('ix_medicine_sales_daily_day', 'day'),
+    )
+
+class StockMovement(db.Model):  # 只追加的库存流水，每次库存变动一行
+    __tablename__ = 'stock_movements'
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
+    movement_date = db.Column(db.Date, nullable=False)  # 业务日期（销售/采购/退货日期）
+    created_at = db.Column(db.DateTime, nullable=False)
+    delta = db.Column(db.Integer, nullable=False)  # 正数入库，负数出库
+    kind = db.Column(db.String(16), nullable=False)  # opening/purchase/sale/order/return/adjustment
+    reference_id = db.Column(db.Integer)  # 对应 purchases/sales/orders/returns 的 id
+
+    __table_args__ = (
+        db.Index('ix_stock_movements_medicine_id_movement_date', 'medicine_id', 'movement_date'),
+    )
+
+class StockSnapshot(db.Model):  # snapshot_date 当天结束时的库存
+    __tablename__ = 'stock_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('medicine_id', 'snapshot_date', name='uq_stock_snapshots_medicine_id_snapshot_date'),
+    )
+
 class Financial(db.Model):
     __tablename__ = 'financials'
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True)
     total_sales = db.Column(db.Numeric(10, 2), default=0.00)
     total_purchases = db.Column(db.Numeric(10, 2), default=0.00)
+    total_returns = db.Column(db.Numeric(10, 2), default=0.00)
     net_profit = db.Column(db.Numeric(10, 2), default=0.00)
 
+class MonthlyFinancial(db.Model):
+    __tablename__ = 'financials_monthly'
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False, unique=True)  # 当月第一天
+    total_sales = db.Column(db.Numeric(12, 2), default=0.00)
+    total_purchases = db.Column(db.Numeric(12, 2), default=0.00)
+    total_returns = db.Column(db.Numeric(12, 2), default=0.00)
+    net_profit = db.Column(db.Numeric(12, 2), default=0.00)
+
 class Inventory(db.Model):
     __tablename__ = 'inventory'
     id = db.Column(db.Integer, primary_key=True)
@@ -79,6 +157,10 @@ class Inventory(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     last_updated = db.Column(db.Date, nullable=False)
 
+    __table_args__ = (
+        db.UniqueConstraint('medicine_id', name='uq_inventory_medicine_id'),
+    )
+
     medicine = db.relationship('Medicine', backref='inventory')
 
 class User(db.Model):
@@ -89,11 +171,20 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self):
+        # 哈希格式为 "方法$盐$摘要"；配置的方法或参数变了，登录成功时按新参数重新哈希
+        return self.password_hash.split('$', 1)[0] != _hash_method(current_app.config['PASSWORD_HASH_METHOD'])
+
+@functools.lru_cache(maxsize=8)
+def _hash_method(method):
+    # werkzeug 会补全省略的参数（如 pbkdf2 -> pbkdf2:sha256:1000000），用一次真实哈希取得完整写法
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
 class Settings(db.Model):
     __tablename__ = 'settings'
     id = db.Column(db.Integer, primary_key=True)
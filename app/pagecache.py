@@ -0,0 +1,90 @@
+import hashlib
+import json
+import time
+from datetime import date
+from functools import wraps
+
+from flask import current_app, make_response, render_template, request, session
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+
+from .cache import VersionedCache, track
+
+# 报表页读取的表 -> 参与渲染的列（None 表示任何改动都失效）。药品、客户只显示名称；
+# 库存报表的 stock 变化总伴随一条 stock_movements 流水，由后者让它失效，这样每笔销售扣库存
+# 不会连带清掉只读名称的销售、退货报表
+REPORT_TABLES = {
+    'medicines': {'name'},
+    'customers': {'name'},
+    'sales': None,
+    'returns': None,
+    'financials': None,
+    'financials_monthly': None,
+    'stock_movements': None,
+}
+LAYOUT_TEMPLATE = '_report_page.html'
+
+# 渲染好的报表正文（不含页头和闪现消息），按 (端点, 当天日期, 查询参数) 缓存
+fragments = VersionedCache(maxsize=256, ttl=60)
+
+
+def _layout_digest(app):
+    # 布局模板和 build-assets 生成的静态文件名都会进入页面，变了 ETag 也要变
+    sources = [app.jinja_env.loader.get_source(app.jinja_env, name)[0] for name in ('base.html', LAYOUT_TEMPLATE)]
+    sources.append(json.dumps(app.extensions.get('assets', {}), sort_keys=True))
+    return hashlib.sha1('\0'.join(sources).encode('utf-8')).hexdigest()
+
+
+def _etag(tables):
+    """Validator built from the request and the change versions of ``tables``, without rendering anything.
+
+    Versions only move in the process that commits, so the current
+    ``REPORT_CACHE_TTL`` window is part of the tag: another worker's commit
+    is picked up by the next window at the latest, the same bound as the
+    fragment cache itself.
+    """
+    parts = (request.endpoint, date.today().isoformat(), sorted(request.args.items(multi=True)),
+             session.get('user_id'), fragments.version(tables), int(time.time() // max(fragments.ttl, 1)),
+             current_app.extensions['pagecache_layout'])
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def cached_page(*tables):
+    """Cache the body a report view renders and answer conditional requests before rendering it.
+
+    The view returns only the page body; the entry is dropped when a commit
+    touches one of ``tables`` (or after ``REPORT_CACHE_TTL`` seconds, which
+    bounds staleness across worker processes). The ETag comes from the
+    tables' change versions, so a matching If-None-Match gets 304 without
+    calling the view or the database, even when the body is not cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if '_flashes' in session:
+                # 带闪现消息的页面与缓存的表示不同，不发校验器
+                return render_template(LAYOUT_TEMPLATE, fragment=_fragment(view, args, kwargs, tables))
+            etag = _etag(tables)
+            if is_resource_modified(request.environ, etag=etag):
+                response = make_response(render_template(LAYOUT_TEMPLATE,
+                                                         fragment=_fragment(view, args, kwargs, tables)))
+            else:
+                response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def _fragment(view, args, kwargs, tables):
+    key = (request.endpoint, date.today(), tuple(sorted(request.args.items(multi=True))))
+    return fragments.get(key, tables, lambda: Markup(view(*args, **kwargs)))
+
+
+def init_app(app):
+    fragments.ttl = app.config.get('REPORT_CACHE_TTL', fragments.ttl)
+    fragments.maxsize = app.config.get('REPORT_CACHE_SIZE', fragments.maxsize)
+    track(fragments, REPORT_TABLES)
+    app.extensions['pagecache_layout'] = _layout_digest(app)
@@ -0,0 +1,233 @@
+import heapq
+import ipaddress
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, has_app_context, request, abort, Response, before_render_template, template_rendered
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_KEPT = 5
+
+
+def _from_loopback():
+    # 没有配置 ProxyFix 时，经反向代理转发的请求 remote_addr 也是 127.0.0.1，只能靠转发头识别
+    if request.headers.get('X-Forwarded-For') and not current_app.config.get('PROXY_FIX_HOPS'):
+        return False
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self.slowest = []  # 小顶堆 [(耗时, 语句)]
+        self._template_started = None
+
+    def record(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (elapsed, statement))
+        else:
+            heapq.heappushpop(self.slowest, (elapsed, statement))
+
+    def slowest_statements(self):
+        return sorted(self.slowest, reverse=True)
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.items() if count > threshold]
+
+
+class Metrics:
+    """Process-wide per-endpoint counters rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status)
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = Counter()
+        self.duration_count = Counter()
+        self.queries = Counter()
+        self.db_time = Counter()
+        self.template_time = Counter()
+        self.n_plus_one = Counter()
+
+    def observe(self, endpoint, method, status, profile, n_plus_one):
+        with self._lock:
+            self.requests[(endpoint, method, str(status))] += 1
+            buckets = self.buckets[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if profile.duration <= bound:
+                    buckets[i] += 1
+            self.duration_sum[endpoint] += profile.duration
+            self.duration_count[endpoint] += 1
+            self.queries[endpoint] += profile.queries
+            self.db_time[endpoint] += profile.db_time
+            self.template_time[endpoint] += profile.template_time
+            if n_plus_one:
+                self.n_plus_one[endpoint] += 1
+
+    def render(self, extra=()):
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+        with self._lock:
+            family('medsales_http_requests_total', 'counter', 'HTTP requests by endpoint, method and status.',
+                   [({'endpoint': e, 'method': m, 'status': s}, v) for (e, m, s), v in sorted(self.requests.items())])
+            lines.append('# HELP medsales_http_request_duration_seconds Request latency.')
+            lines.append('# TYPE medsales_http_request_duration_seconds histogram')
+            for endpoint in sorted(self.buckets):
+                for bound, count in zip(DURATION_BUCKETS, self.buckets[endpoint]):
+                    labels = _labels({'endpoint': endpoint, 'le': _number(bound)})
+                    lines.append(f'medsales_http_request_duration_seconds_bucket{labels} {count}')
+                labels = _labels({'endpoint': endpoint, 'le': '+Inf'})
+                lines.append(f'medsales_http_request_duration_seconds_bucket{labels} {self.duration_count[endpoint]}')
+                labels = _labels({'endpoint': endpoint})
+                lines.append(f'medsales_http_request_duration_seconds_sum{labels} {_number(self.duration_sum[endpoint])}')
+                lines.append(f'medsales_http_request_duration_seconds_count{labels} {self.duration_count[endpoint]}')
+            for name, help_text, counter in (
+                    ('medsales_db_queries_total', 'SQL statements executed.', self.queries),
+                    ('medsales_db_time_seconds_total', 'Time spent executing SQL.', self.db_time),
+                    ('medsales_template_render_seconds_total', 'Time spent rendering templates.', self.template_time),
+                    ('medsales_n_plus_one_requests_total', 'Requests that repeated one statement too often.',
+                     self.n_plus_one)):
+                family(name, 'counter', help_text, [({'endpoint': e}, v) for e, v in sorted(counter.items())])
+        for name, kind, help_text, samples in extra:
+            family(name, kind, help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def current_profile():
+    return g.get('profile') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = conn.info.get('profile_started')
+    if profile is not None and started:
+        profile.record(statement, time.perf_counter() - started.pop())
+
+
+def _before_render(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile._template_started = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile._template_started is not None:
+        profile.template_time += time.perf_counter() - profile._template_started
+        profile._template_started = None
+
+
+def _footer(profile):
+    rows = ''.join(f'<li>{elapsed * 1000:.1f} ms: <code>{escape(statement)}</code></li>'
+                   for elapsed, statement in profile.slowest_statements())
+    return (f'<div class="profiler-footer"><p>总耗时 {profile.duration * 1000:.1f} ms, '
+            f'SQL {profile.queries} 条 / {profile.db_time * 1000:.1f} ms, '
+            f'模板 {profile.template_time * 1000:.1f} ms</p><ul>{rows}</ul></div>')
+
+
+def init_app(app):
+    if not app.config.get('PROFILER_ENABLED', True):
+        return
+    threshold = app.config.get('PROFILER_N_PLUS_ONE_THRESHOLD', 10)
+    slow_query = app.config.get('PROFILER_SLOW_QUERY_MS', 200) / 1000.0
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_profile():
+        g.profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profile.duration = time.perf_counter() - profile.started
+        endpoint = request.endpoint or 'unknown'
+
+        repeated = profile.repeated(threshold)
+        for statement, count in repeated:
+            app.logger.warning('Possible N+1 in %s: statement executed %d times: %s', endpoint, count, statement)
+        for elapsed, statement in profile.slowest_statements():
+            if elapsed >= slow_query:
+                app.logger.warning('Slow query in %s (%.1f ms): %s', endpoint, elapsed * 1000, statement)
+        metrics.observe(endpoint, request.method, response.status_code, profile, bool(repeated))
+
+        response.headers['Server-Timing'] = (f'db;dur={profile.db_time * 1000:.1f}, '
+                                             f'tpl;dur={profile.template_time * 1000:.1f}, '
+                                             f'total;dur={profile.duration * 1000:.1f}')
+        if (app.config.get('PROFILER_FOOTER') and response.mimetype == 'text/html'
+                and not response.is_streamed and not response.direct_passthrough):
+            html = response.get_data(as_text=True)
+            if '</body>' in html:
+                response.set_data(html.replace('</body>', _footer(profile) + '</body>', 1))
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(403)
+        elif not _from_loopback():
+            abort(403)
+        from .cache import reference_data
+        from .pagecache import fragments
+        stats = reference_data.stats()
+        pages = fragments.stats()
+        extra = [
+            ('medsales_reference_cache_hits_total', 'counter', 'Reference data cache hits.', [({}, stats['hits'])]),
+            ('medsales_reference_cache_misses_total', 'counter', 'Reference data cache misses.',
+             [({}, stats['misses'])]),
+            ('medsales_report_cache_hits_total', 'counter', 'Report fragment cache hits.', [({}, pages['hits'])]),
+            ('medsales_report_cache_misses_total', 'counter', 'Report fragment cache misses.',
+             [({}, pages['misses'])]),
+        ]
+        return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
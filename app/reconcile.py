@@ -0,0 +1,119 @@
+from datetime import date
+
+from sqlalchemy import case, delete, func, insert, or_, select, update
+from sqlalchemy.orm import aliased
+
+from . import db, ledger
+from .models import Medicine, Purchase, Sale, Inventory, StockMovement
+from .services import _execute
+
+
+class Divergence:
+    def __init__(self, medicine_id, name, stock, opening_stock, movements, inventory_rows, inventory,
+                 ledger_balance):
+        self.medicine_id = medicine_id
+        self.name = name
+        self.stock = stock
+        self.opening_stock = opening_stock
+        self.movements = movements
+        self.inventory_rows = inventory_rows or 0
+        self.inventory = inventory
+        self.ledger_balance = ledger_balance or 0
+
+    @property
+    def baseline_missing(self):
+        # 没有初始库存（例如直接导入的数据）时只能以当前 stock 为准
+        return self.opening_stock is None
+
+    @property
+    def expected(self):
+        if self.baseline_missing:
+            return self.stock
+        return self.opening_stock + self.movements
+
+    @property
+    def duplicates(self):
+        return max(self.inventory_rows - 1, 0)
+
+
+def divergences():
+    """Find every medicine whose stock, inventory row or ledger disagrees with its movements, in one query.
+
+    Expected stock is ``opening_stock + purchases - sales``. Returns are not
+    added separately: booking a return already lowers ``sales.quantity``.
+    """
+    purchased = select(Purchase.medicine_id, func.sum(Purchase.quantity).label('quantity')) \
+        .group_by(Purchase.medicine_id).subquery()
+    sold = select(Sale.medicine_id, func.sum(Sale.quantity).label('quantity')) \
+        .group_by(Sale.medicine_id).subquery()
+    inventory = select(Inventory.medicine_id, func.count(Inventory.id).label('rows'),
+                       func.min(Inventory.id).label('keep_id')) \
+        .group_by(Inventory.medicine_id).subquery()
+    kept = aliased(Inventory)
+    ledgered = select(StockMovement.medicine_id, func.sum(StockMovement.delta).label('quantity')) \
+        .group_by(StockMovement.medicine_id).subquery()
+
+    movements = func.coalesce(purchased.c.quantity, 0) - func.coalesce(sold.c.quantity, 0)
+    expected = func.coalesce(Medicine.opening_stock + movements, Medicine.stock)
+    stmt = select(Medicine.id, Medicine.name, Medicine.stock, Medicine.opening_stock, movements.label('movements'),
+                  inventory.c.rows, kept.quantity, ledgered.c.quantity) \
+        .outerjoin(purchased, purchased.c.medicine_id == Medicine.id) \
+        .outerjoin(sold, sold.c.medicine_id == Medicine.id) \
+        .outerjoin(inventory, inventory.c.medicine_id == Medicine.id) \
+        .outerjoin(kept, kept.id == inventory.c.keep_id) \
+        .outerjoin(ledgered, ledgered.c.medicine_id == Medicine.id) \
+        .where(or_(Medicine.opening_stock.is_(None), Medicine.stock != expected,
+                   inventory.c.rows.is_(None), inventory.c.rows != 1, kept.quantity != expected,
+                   func.coalesce(ledgered.c.quantity, 0) != expected)) \
+        .order_by(Medicine.id)
+    return [Divergence(*row) for row in db.session.execute(stmt)]
+
+
+def _repair(found):
+    """Bring ``medicines.stock``, ``inventory`` and the ledger in line with the movements; drop duplicate rows.
+
+    Corrections are applied as deltas so sales committed while the job runs are not overwritten.
+    """
+    if not found:
+        return
+    baselines = {d.medicine_id: d.stock - d.movements for d in found if d.baseline_missing}
+    if baselines:
+        _execute(update(Medicine).where(Medicine.id.in_(baselines))
+                 .values(opening_stock=case(baselines, value=Medicine.id)))
+
+    stock = {d.medicine_id: d.expected - d.stock for d in found if d.expected != d.stock}
+    if stock:
+        _execute(update(Medicine).where(Medicine.id.in_(stock))
+                 .values(stock=Medicine.stock + case(stock, value=Medicine.id)))
+
+    duplicated = [d.medicine_id for d in found if d.duplicates]
+    if duplicated:
+        # 保留 id 最小的一行，与迁移 a7d24c19e653 的去重规则一致
+        keep = db.session.scalars(select(func.min(Inventory.id)).where(Inventory.medicine_id.in_(duplicated))
+                                  .group_by(Inventory.medicine_id)).all()
+        _execute(delete(Inventory).where(Inventory.medicine_id.in_(duplicated), Inventory.id.notin_(keep)))
+
+    inventory = {d.medicine_id: d.expected - d.inventory for d in found
+                 if d.inventory is not None and d.inventory != d.expected}
+    if inventory:
+        _execute(update(Inventory).where(Inventory.medicine_id.in_(inventory))
+                 .values(quantity=Inventory.quantity + case(inventory, value=Inventory.medicine_id),
+                         last_updated=date.today()))
+
+    missing = [{'medicine_id': d.medicine_id, 'quantity': d.expected, 'last_updated': date.today()}
+               for d in found if d.inventory is None]
+    if missing:
+        db.session.execute(insert(Inventory), missing)
+
+    # 流水只追加：差额记成一条 adjustment
+    ledger.record([(d.medicine_id, d.expected - d.ledger_balance, 'adjustment', date.today(), None)
+                   for d in found if d.ledger_balance != d.expected])
+    db.session.commit()
+
+
+def reconcile(repair=False):
+    """Report (and with ``repair`` fix) stock divergences; returns the list found before repairing."""
+    found = divergences()
+    if repair:
+        _repair(found)
+    return found
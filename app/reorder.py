@@ -0,0 +1,120 @@
+import math
+from datetime import date, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .choices import supplier_choices
+from .models import Medicine, MedicineDailySales, Purchase, Sale
+
+SHORT_WINDOW = 7
+LONG_WINDOW = 30
+
+
+class Suggestion:
+    def __init__(self, medicine_id, name, stock, sold_short, sold_long, supplier_id=None, supplier=None):
+        self.medicine_id = medicine_id
+        self.name = name
+        self.stock = stock
+        self.velocity_short = sold_short / SHORT_WINDOW
+        self.velocity_long = sold_long / LONG_WINDOW
+        self.supplier_id = supplier_id
+        self.supplier = supplier
+        self.quantity = 0
+
+    @property
+    def velocity(self):
+        # 取较快的一个，短期放量时也能及时提醒
+        return max(self.velocity_short, self.velocity_long)
+
+    @property
+    def days_of_cover(self):
+        return self.stock / self.velocity if self.velocity else math.inf
+
+
+def _update_daily(day, quantities):
+    delta = case(quantities, value=MedicineDailySales.medicine_id)
+    stmt = update(MedicineDailySales) \
+        .where(MedicineDailySales.day == day, MedicineDailySales.medicine_id.in_(quantities)) \
+        .values(quantity=MedicineDailySales.quantity + delta) \
+        .execution_options(synchronize_session=False)
+    return db.session.execute(stmt).rowcount
+
+
+def record_sales(day, quantities):
+    """Add ``{medicine_id: quantity}`` (negative for returns) to the daily rollup; the caller commits."""
+    quantities = {medicine_id: quantity for medicine_id, quantity in quantities.items() if quantity}
+    if not quantities or _update_daily(day, quantities) == len(quantities):
+        return
+    existing = set(db.session.scalars(select(MedicineDailySales.medicine_id).where(
+        MedicineDailySales.day == day, MedicineDailySales.medicine_id.in_(quantities))))
+    missing = {medicine_id: quantity for medicine_id, quantity in quantities.items() if medicine_id not in existing}
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(MedicineDailySales), [
+                {'medicine_id': medicine_id, 'day': day, 'quantity': quantity}
+                for medicine_id, quantity in missing.items()
+            ])
+    except IntegrityError:
+        # 并发请求先插入了同一天的行，改为累加
+        _update_daily(day, missing)
+
+
+def velocities(today=None, medicine_ids=None):
+    """``{medicine_id: (sold in the last 7 days, sold in the last 30 days)}`` from the daily rollup."""
+    today = today or date.today()
+    short_start = today - timedelta(days=SHORT_WINDOW - 1)
+    stmt = select(MedicineDailySales.medicine_id,
+                  func.sum(case((MedicineDailySales.day >= short_start, MedicineDailySales.quantity), else_=0)),
+                  func.sum(MedicineDailySales.quantity)) \
+        .where(MedicineDailySales.day.between(today - timedelta(days=LONG_WINDOW - 1), today)) \
+        .group_by(MedicineDailySales.medicine_id)
+    if medicine_ids is not None:
+        stmt = stmt.where(MedicineDailySales.medicine_id.in_(medicine_ids))
+    return {medicine_id: (short or 0, long or 0) for medicine_id, short, long in db.session.execute(stmt)}
+
+
+def _last_suppliers(medicine_ids):
+    # 每种药品最近一次采购的供应商
+    latest = select(func.max(Purchase.id)) \
+        .where(Purchase.medicine_id.in_(medicine_ids), Purchase.supplier_id.isnot(None)) \
+        .group_by(Purchase.medicine_id)
+    return dict(db.session.execute(
+        select(Purchase.medicine_id, Purchase.supplier_id).where(Purchase.id.in_(latest))).all())
+
+
+def suggestions(days_of_cover=14, target_days=30, today=None):
+    """Medicines whose stock covers fewer than ``days_of_cover`` days of sales, with a purchase quantity
+    that brings them up to ``target_days``, ordered by supplier and urgency."""
+    sold = velocities(today)
+    if not sold:
+        return []
+    low = []
+    for medicine_id, name, stock, supplier_id in db.session.execute(
+            select(Medicine.id, Medicine.name, Medicine.stock, Medicine.supplier_id).where(Medicine.id.in_(sold))):
+        suggestion = Suggestion(medicine_id, name, stock, *sold[medicine_id], supplier_id=supplier_id)
+        if suggestion.days_of_cover < days_of_cover:
+            suggestion.quantity = max(math.ceil(suggestion.velocity * target_days) - stock, 0)
+            low.append(suggestion)
+    if not low:
+        return []
+
+    last_suppliers = _last_suppliers([s.medicine_id for s in low])
+    names = dict(supplier_choices())
+    for suggestion in low:
+        suggestion.supplier_id = last_suppliers.get(suggestion.medicine_id, suggestion.supplier_id)
+        suggestion.supplier = names.get(suggestion.supplier_id)
+    return sorted(low, key=lambda s: (s.supplier is None, s.supplier or '', s.days_of_cover))
+
+
+def rebuild():
+    """Recompute the daily rollup from ``sales``; returns the number of rows written."""
+    db.session.execute(delete(MedicineDailySales))
+    # sales.quantity 已扣除退货，按销售日期汇总即为净销量
+    result = db.session.execute(insert(MedicineDailySales).from_select(
+        ['medicine_id', 'day', 'quantity'],
+        select(Sale.medicine_id, Sale.sale_date, func.sum(Sale.quantity))
+        .group_by(Sale.medicine_id, Sale.sale_date)))
+    db.session.commit()
+    return result.rowcount
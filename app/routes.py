@@ -1,54 +1,52 @@
-from flask import render_template, request, redirect, url_for, flash, session
-from sqlalchemy import func
+from flask import render_template, request, redirect, url_for, flash, session, abort, jsonify, Response, stream_with_context
+from sqlalchemy.orm import joinedload, load_only
 from functools import wraps
+import io
+import logging
 from datetime import date, datetime
 from . import db
-from .models import Medicine, Supplier, Employee, Customer, Purchase, Return, Sale, User, Financial, Inventory
-from .forms import MedicineForm, EmployeeForm, CustomerForm, SupplierForm, PurchaseForm, ReturnForm, SaleForm, UserForm, LoginForm
+from .models import Medicine, Supplier, Employee, Customer, Purchase, Return, Sale, User, Financial, MonthlyFinancial, Inventory
+from .forms import MedicineForm, EmployeeForm, CustomerForm, SupplierForm, PurchaseForm, ReturnForm, SaleForm, CheckoutForm, ImportForm, UserForm, LoginForm
+from .listing import paginate_request
+from . import analytics, auth, choices, export, financials, importer, ledger, logview, reorder, search, services
+from .cache import reference_data
+from .dashboard import kpis as dashboard_kpis
+from .eventlog import log_event
+from .pagecache import cached_page
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        # 当前用户走缓存，不必每个请求查询 users 表
+        if auth.current_user() is None:
             flash('请登录以访问此页面。')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
-def update_financials(date):
-    total_sales = db.session.query(func.sum(Sale.total_price)).filter(func.date(Sale.sale_date) == date).scalar() or 0
-    total_returns = db.session.query(func.sum(Return.quantity * (Sale.total_price / Sale.quantity))) \
-        .select_from(Return).join(Sale).filter(func.date(Return.return_date) == date).scalar() or 0
-    net_profit = total_sales - total_returns
-
-    financial_record = db.session.query(Financial).filter_by(date=date).first()
-    if financial_record:
-        financial_record.total_sales = total_sales
-        financial_record.net_profit = net_profit
-    else:
-        new_financial_record = Financial(
-            date=date,
-            total_sales=total_sales,
-            net_profit=net_profit
-        )
-        db.session.add(new_financial_record)
-
-    db.session.commit()
-
-def update_inventory(medicine_id, quantity_change):
-    inventory_record = db.session.query(Inventory).filter_by(medicine_id=medicine_id).first()
-    if inventory_record:
-        inventory_record.quantity += quantity_change
-        inventory_record.last_updated = date.today()
-    else:
-        new_inventory_record = Inventory(
-            medicine_id=medicine_id,
-            quantity=quantity_change,
-            last_updated=date.today()
-        )
-        db.session.add(new_inventory_record)
-
-    db.session.commit()
+def sale_listing():
+    # 一次 JOIN 取出模板要用的药品名和客户名，避免逐行懒加载 (N+1)
+    return Sale.query.options(
+        load_only(Sale.quantity, Sale.sale_date, Sale.total_price),
+        joinedload(Sale.medicine).load_only(Medicine.name),
+        joinedload(Sale.customer).load_only(Customer.name),
+    )
+
+def purchase_listing():
+    return Purchase.query.options(
+        load_only(Purchase.quantity, Purchase.purchase_date),
+        joinedload(Purchase.medicine).load_only(Medicine.name),
+        joinedload(Purchase.supplier).load_only(Supplier.name),
+    )
+
+def return_listing():
+    return Return.query.options(
+        load_only(Return.quantity, Return.return_date),
+        joinedload(Return.sale).load_only(Sale.id).options(
+            joinedload(Sale.medicine).load_only(Medicine.name),
+            joinedload(Sale.customer).load_only(Customer.name),
+        ),
+    )
 
 def register_routes(app):
     @app.route('/')
@@ -58,31 +56,30 @@ def register_routes(app):
     @app.route('/medicines')
     @login_required
     def list_medicines():
-        medicines = Medicine.query.all()
-        return render_template('medicines.html', medicines=medicines)
+        page = paginate_request(
+            Medicine.query.options(load_only(Medicine.name, Medicine.description, Medicine.price, Medicine.stock)),
+            [Medicine.id])
+        return render_template('medicines.html', medicines=page.items, page=page)
 
     @app.route('/add_medicine', methods=['GET', 'POST'])
     @login_required
     def add_medicine():
         form = MedicineForm()
         if form.validate_on_submit():
-            new_medicine = Medicine(
+            services.create_medicine(
                 name=form.name.data,
                 description=form.description.data,
                 price=form.price.data,
                 stock=form.stock.data
             )
-            db.session.add(new_medicine)
-            db.session.commit()
-            update_inventory(new_medicine.id, new_medicine.stock)
             return redirect(url_for('list_medicines'))
         return render_template('add_medicine.html', form=form)
 
     @app.route('/employees')
     @login_required
     def list_employees():
-        employees = Employee.query.all()
-        return render_template('employees.html', employees=employees)
+        page = paginate_request(Employee.query, [Employee.id])
+        return render_template('employees.html', employees=page.items, page=page)
 
     @app.route('/add_employee', methods=['GET', 'POST'])
     @login_required
@@ -103,8 +100,8 @@ def register_routes(app):
     @app.route('/customers')
     @login_required
     def list_customers():
-        customers = Customer.query.all()
-        return render_template('customers.html', customers=customers)
+        page = paginate_request(Customer.query, [Customer.id])
+        return render_template('customers.html', customers=page.items, page=page)
 
     @app.route('/add_customer', methods=['GET', 'POST'])
     @login_required
@@ -124,8 +121,8 @@ def register_routes(app):
     @app.route('/suppliers')
     @login_required
     def list_suppliers():
-        suppliers = Supplier.query.all()
-        return render_template('suppliers.html', suppliers=suppliers)
+        page = paginate_request(Supplier.query, [Supplier.id])
+        return render_template('suppliers.html', suppliers=page.items, page=page)
 
     @app.route('/add_supplier', methods=['GET', 'POST'])
     @login_required
@@ -145,169 +142,257 @@ def register_routes(app):
     @app.route('/purchases')
     @login_required
     def list_purchases():
-        purchases = Purchase.query.all()
-        return render_template('purchases.html', purchases=purchases)
+        page = paginate_request(purchase_listing(), [Purchase.purchase_date, Purchase.id])
+        return render_template('purchases.html', purchases=page.items, page=page)
 
     @app.route('/add_purchase', methods=['GET', 'POST'])
     @login_required
     def add_purchase():
         form = PurchaseForm()
-        form.medicine_id.choices = [(m.id, m.name) for m in Medicine.query.all()]
-        form.supplier_id.choices = [(s.id, s.name) for s in Supplier.query.all()]
+        form.supplier_id.choices = choices.supplier_choices()
 
         if form.validate_on_submit():
-            new_purchase = Purchase(
-                medicine_id=form.medicine_id.data,
-                quantity=form.quantity.data,
-                purchase_date=form.purchase_date.data,
-                supplier_id=form.supplier_id.data
-            )
-            db.session.add(new_purchase)
-
-            medicine = Medicine.query.get(form.medicine_id.data)
-            if medicine:
-                medicine.stock += form.quantity.data
-
-            db.session.commit()
-            update_inventory(form.medicine_id.data, form.quantity.data)
-            return redirect(url_for('list_purchases'))
+            try:
+                purchase = services.record_purchase(
+                    medicine_id=form.medicine_id.data,
+                    supplier_id=form.supplier_id.data,
+                    quantity=form.quantity.data,
+                    purchase_date=form.purchase_date.data
+                )
+                log_event('purchase', purchase_id=purchase.id, medicine_id=form.medicine_id.data,
+                          supplier_id=form.supplier_id.data, quantity=form.quantity.data)
+                return redirect(url_for('list_purchases'))
+            except services.ServiceError as e:
+                flash(str(e))
         return render_template('add_purchase.html', form=form)
 
     @app.route('/returns', methods=['GET', 'POST'])
     @login_required
     def process_return():
         form = ReturnForm()
-        form.sale_id.choices = [(s.id, f"{s.medicine.name} - {s.sale_date} - {s.quantity} sold") for s in
-                                Sale.query.all()]
 
         if form.validate_on_submit():
-            sale = Sale.query.get(form.sale_id.data)
-            if sale and sale.quantity >= form.quantity.data:
-                # Get the unit price from the Medicine table
-                medicine = sale.medicine
-                if medicine:
-                    unit_price = medicine.price
-                    refund_amount = unit_price * form.quantity.data
-
-                    # Create a new return record
-                    new_return = Return(
-                        sale_id=form.sale_id.data,
-                        quantity=form.quantity.data,
-                        return_date=form.return_date.data
-                    )
-                    db.session.add(new_return)
-
-                    # Update the medicine stock
-                    medicine.stock += form.quantity.data
-
-                    # Update the sale record
-                    sale.quantity -= form.quantity.data
-
-                    db.session.commit()
-                    update_inventory(sale.medicine_id, form.quantity.data)
-                    update_financials(form.return_date.data)
-
-                    print(f"Refund amount: {refund_amount}")
-
-                    return redirect(url_for('inventory_report'))
-                else:
-                    flash('未找到药品。')
-            else:
-                flash('退货数量超过销售数量。')
+            try:
+                new_return, refund_amount = services.record_return(
+                    sale_id=form.sale_id.data,
+                    quantity=form.quantity.data,
+                    return_date=form.return_date.data
+                )
+                log_event('return', return_id=new_return.id, sale_id=form.sale_id.data,
+                          quantity=form.quantity.data, refund_amount=refund_amount)
+                return redirect(url_for('inventory_report'))
+            except services.ServiceError as e:
+                flash(str(e))
         return render_template('process_return.html', form=form)
 
     @app.route('/inventory_report')
     @login_required
+    @cached_page('medicines', 'stock_movements')
     def inventory_report():
-        medicines = Medicine.query.all()
-        return render_template('inventory_report.html', medicines=medicines)
+        page = paginate_request(Medicine.query.options(load_only(Medicine.name, Medicine.stock)), [Medicine.id])
+        as_of = request.args.get('as_of')
+        historical = None
+        if as_of:
+            try:
+                as_of = date.fromisoformat(as_of)
+            except ValueError:
+                abort(400)
+            # 历史库存 = 最近一次快照 + 之后的流水，只查本页的药品
+            historical = ledger.stock_on(as_of, [medicine.id for medicine in page.items])
+        return render_template('inventory_report.html', medicines=page.items, page=page,
+                               as_of=as_of, historical=historical)
+
+    @app.route('/reorder_report')
+    @login_required
+    def reorder_report():
+        days_of_cover = request.args.get('days', app.config['REORDER_DAYS_OF_COVER'], type=int)
+        target_days = max(app.config['REORDER_TARGET_DAYS'], days_of_cover)
+        suggestions = reorder.suggestions(days_of_cover=days_of_cover, target_days=target_days)
+        return render_template('reorder_report.html', suggestions=suggestions, days_of_cover=days_of_cover,
+                               target_days=target_days)
+
+    @app.route('/api/stock/<int:medicine_id>')
+    @login_required
+    def stock_history(medicine_id):
+        try:
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+            start = date.fromisoformat(request.args['start']) if request.args.get('start') else end.replace(day=1)
+        except ValueError:
+            abort(400)
+        return jsonify([{'date': day.isoformat(), 'change': change, 'balance': balance}
+                        for day, change, balance in ledger.stock_history(medicine_id, start, end)])
 
     @app.route('/sales')
     @login_required
     def list_sales():
-        sales = Sale.query.all()
-        return render_template('sales.html', sales=sales)
+        page = paginate_request(sale_listing(), [Sale.sale_date, Sale.id])
+        return render_template('sales.html', sales=page.items, page=page)
 
     @app.route('/add_sale', methods=['GET', 'POST'])
     @login_required
     def add_sale():
         form = SaleForm()
-        form.medicine_id.choices = [(m.id, m.name) for m in Medicine.query.all()]
-        form.customer_id.choices = [(c.id, c.name) for c in Customer.query.all()]
 
         if form.validate_on_submit():
-            medicine = Medicine.query.get(form.medicine_id.data)
-            if medicine and medicine.stock >= form.quantity.data:
-                total_price = medicine.price * form.quantity.data
-
-                new_sale = Sale(
+            try:
+                sale = services.record_sale(
                     medicine_id=form.medicine_id.data,
                     customer_id=form.customer_id.data,
                     quantity=form.quantity.data,
-                    sale_date=form.sale_date.data,
-                    total_price=total_price
+                    sale_date=form.sale_date.data
                 )
-                db.session.add(new_sale)
+                log_event('sale', sale_id=sale.id, medicine_id=form.medicine_id.data,
+                          customer_id=form.customer_id.data, quantity=form.quantity.data)
+                return redirect(url_for('list_sales'))
+            except services.ServiceError as e:
+                flash(str(e))
+        return render_template('add_sale.html', form=form)
 
-                medicine.stock -= form.quantity.data
+    @app.route('/checkout', methods=['GET', 'POST'])
+    @login_required
+    def checkout():
+        form = CheckoutForm()
 
-                db.session.commit()
-                update_inventory(form.medicine_id.data, -form.quantity.data)
-                update_financials(form.sale_date.data)
+        if form.validate_on_submit():
+            # LineItemForm 已拒绝半填的行，剩下的空行直接跳过
+            items = [(item.medicine_id.data, item.quantity.data) for item in form.items if item.medicine_id.data]
+            try:
+                order = services.record_order(
+                    customer_id=form.customer_id.data,
+                    order_date=form.sale_date.data,
+                    items=items
+                )
+                log_event('order', order_id=order.id, customer_id=form.customer_id.data, lines=len(items),
+                          total_price=order.total_price)
+                flash(f'结账成功，共 {len(items)} 项，总价 {order.total_price}。')
                 return redirect(url_for('list_sales'))
-            else:
-                flash('库存不足。')
-        return render_template('add_sale.html', form=form)
+            except services.ServiceError as e:
+                flash(str(e))
+        return render_template('checkout.html', form=form)
 
     @app.route('/sales_report')
     @login_required
+    @cached_page('sales', 'returns', 'financials', 'medicines', 'customers')
     def sales_report():
-        sales = Sale.query.all()
-        return render_template('sales_report.html', sales=sales)
+        # 汇总视图；逐笔明细见 /sales
+        start, end = analytics.default_range()
+        try:
+            start = date.fromisoformat(request.args['start']) if request.args.get('start') else start
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else end
+        except ValueError:
+            abort(400)
+        if start > end or (end - start).days > 3660:
+            abort(400)
+        period = request.args.get('period', 'day')
+        if period not in analytics.PERIODS:
+            abort(400)
+        by = 'quantity' if request.args.get('by') == 'quantity' else 'revenue'
+        return render_template('sales_report.html', start=start, end=end, period=period, by=by,
+                               revenue=analytics.revenue(start, end, period),
+                               comparison=analytics.comparison(start, end),
+                               top_medicines=analytics.top_medicines(start, end, by=by),
+                               top_customers=analytics.top_customers(start, end, by=by),
+                               return_rates=analytics.return_rates(start, end))
 
     @app.route('/returns_report')
     @login_required
+    @cached_page('returns', 'medicines', 'customers')
     def returns_report():
-        returns = Return.query.all()
-        return render_template('returns_report.html', returns=returns)
+        page = paginate_request(return_listing(), [Return.return_date, Return.id])
+        return render_template('returns_report.html', returns=page.items, page=page)
 
     @app.route('/financial_report')
     @login_required
+    @cached_page('financials', 'financials_monthly')
     def financial_report():
         today = date.today()
 
-        # Calculate today's sales
-        today_sales = db.session.query(func.sum(Sale.total_price)).filter(
-            func.date(Sale.sale_date) == today).scalar() or 0
-
-        # Calculate today's returns
-        today_returns = db.session.query(func.sum(Return.quantity * Medicine.price)) \
-                            .select_from(Return).join(Sale).join(Medicine).filter(
-            func.date(Return.return_date) == today).scalar() or 0
+        # 直接读取预先累计好的日/月汇总行，不再扫描 sales/returns
+        day = Financial.query.filter_by(date=today).first()
+        month = MonthlyFinancial.query.filter_by(month=financials.month_start(today)).first()
 
+        today_sales = day.total_sales if day else 0
+        today_returns = day.total_returns if day else 0
         today_net = today_sales - today_returns
 
-        # Calculate this month's sales
-        first_day_of_month = today.replace(day=1)
-        month_sales = db.session.query(func.sum(Sale.total_price)).filter(
-            Sale.sale_date >= first_day_of_month).scalar() or 0
-
-        # Calculate this month's returns
-        month_returns = db.session.query(func.sum(Return.quantity * Medicine.price)) \
-                            .select_from(Return).join(Sale).join(Medicine).filter(
-            Return.return_date >= first_day_of_month).scalar() or 0
-
+        month_sales = month.total_sales if month else 0
+        month_returns = month.total_returns if month else 0
         month_net = month_sales - month_returns
 
         return render_template('financial_report.html', today_sales=today_sales, today_returns=today_returns,
                                today_net=today_net, month_sales=month_sales, month_returns=month_returns,
                                month_net=month_net)
 
+    @app.route('/export/<name>')
+    @login_required
+    def export_table(name):
+        fmt = request.args.get('format', 'csv')
+        if name not in export.EXPORTS or fmt not in export.FORMATS:
+            abort(404)
+        try:
+            start = request.args.get('start')
+            end = request.args.get('end')
+            filters = {key: request.args.get(key, type=int) for key in export.EXPORTS[name].filters}
+            stmt = export.build_query(name,
+                                      start=date.fromisoformat(start) if start else None,
+                                      end=date.fromisoformat(end) if end else None,
+                                      **filters)
+        except ValueError:
+            abort(400)
+        response = Response(stream_with_context(export.stream_rows(stmt, fmt)), mimetype=export.FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+        return response
+
+    @app.route('/import', methods=['GET', 'POST'])
+    @login_required
+    def import_data():
+        form = ImportForm()
+        result = None
+        if form.validate_on_submit():
+            stream = io.TextIOWrapper(form.file.data.stream, encoding='utf-8-sig', newline='')
+            result = importer.import_csv(form.kind.data, stream)
+            flash(f'已导入 {result.imported} 行，{len(result.errors)} 行有错误。')
+        return render_template('import.html', form=form, result=result)
+
+    @app.route('/api/search/medicines')
+    @login_required
+    def search_medicines():
+        return jsonify(search.search_medicines(request.args.get('q', ''), request.args.get('limit', type=int)))
+
+    @app.route('/api/search/customers')
+    @login_required
+    def search_customers():
+        return jsonify(search.search_customers(request.args.get('q', ''), request.args.get('limit', type=int)))
+
+    @app.route('/api/search/sales')
+    @login_required
+    def search_sales():
+        try:
+            start = request.args.get('start')
+            end = request.args.get('end')
+            start = date.fromisoformat(start) if start else None
+            end = date.fromisoformat(end) if end else None
+        except ValueError:
+            abort(400)
+        return jsonify(search.search_sales(
+            request.args.get('q', ''),
+            customer_id=request.args.get('customer_id', type=int),
+            medicine_id=request.args.get('medicine_id', type=int),
+            start=start,
+            end=end,
+            limit=request.args.get('limit', type=int),
+        ))
+
+    @app.route('/cache_stats')
+    @login_required
+    def cache_stats():
+        return jsonify(reference_data.stats())
+
     @app.route('/users')
     @login_required
     def list_users():
-        users = User.query.all()
-        return render_template('users.html', users=users)
+        page = paginate_request(User.query.options(load_only(User.username, User.is_admin)), [User.id])
+        return render_template('users.html', users=page.items, page=page)
 
     @app.route('/add_user', methods=['GET', 'POST'])
     @login_required
@@ -328,27 +413,69 @@ def register_routes(app):
     @app.route('/view_logs')
     @login_required
     def view_logs():
-        with open('logs/app.log', 'r') as f:
-            log_content = f.read()
-        return render_template('view_logs.html', log_content=log_content)
+        level = request.args.get('level') or None
+        lines = max(1, min(request.args.get('lines', logview.DEFAULT_LINES, type=int) or logview.DEFAULT_LINES,
+                           logview.MAX_LINES))
+        try:
+            start = request.args.get('start')
+            end = request.args.get('end')
+            start = datetime.fromisoformat(start) if start else None
+            end = datetime.fromisoformat(end) if end else None
+            records, next_cursor = logview.tail(app.config['LOG_FILE'], lines=lines, level=level,
+                                                start=start, end=end, cursor=request.args.get('cursor'))
+        except ValueError:
+            abort(400)
+        return render_template('view_logs.html', records=records, next_cursor=next_cursor,
+                               levels=logview.LEVELS, level=level, lines=lines)
+
+    @app.route('/view_logs/stream')
+    @login_required
+    def stream_logs():
+        logview.streams.limit = app.config['LOG_STREAM_MAX_CLIENTS']
+        if not logview.streams.acquire():
+            # 每个流占住一个 gthread 线程直到超时，满了就让客户端稍后再连，不挤占普通请求
+            return Response('实时日志连接数已满，请稍后再试。', status=503, headers={'Retry-After': '30'})
+        events = logview.follow(app.config['LOG_FILE'], level=request.args.get('level') or None,
+                                timeout=app.config['LOG_STREAM_SECONDS'])
+        response = Response(events, mimetype='text/event-stream')
+        response.call_on_close(logview.streams.release)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
 
     @app.route('/dashboard')
     @login_required
     def dashboard():
-        # 只有登录用户才能访问此页面
-        return render_template('dashboard.html')
+        # 只有登录用户才能访问此页面；指标来自内存中的快照，不查询数据库
+        return render_template('dashboard.html', kpis=dashboard_kpis.get())
 
     @app.route('/login', methods=['GET', 'POST'])
     def login():
         form = LoginForm()
         if form.validate_on_submit():
-            user = User.query.filter_by(username=form.username.data).first()
+            username, ip = form.username.data, request.remote_addr or ''
+            # 失败次数超限时在查询用户、计算哈希之前就拒绝
+            retry_after = auth.throttle.retry_after(username, ip)
+            if retry_after:
+                log_event('login_throttled', level=logging.WARNING, username=username, retry_after=retry_after)
+                flash(f'登录失败次数过多，请 {-(-retry_after // 60)} 分钟后再试。', 'danger')
+                return render_template('login.html', form=form), 429, {'Retry-After': str(retry_after)}
+            user = User.query.filter_by(username=username).first()
             if user and user.check_password(form.password.data):
+                if user.needs_rehash():
+                    # 哈希参数调整过：用刚验证过的明文按新参数重新哈希
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                    log_event('password_rehash', user_id=user.id)
+                auth.throttle.succeeded(username)
                 session['user_id'] = user.id
                 session['username'] = user.username  # 保存用户名以便显示
+                log_event('login', user_id=user.id, success=True)
                 flash('登录成功。', 'success')
                 return redirect(url_for('index'))
             else:
+                auth.throttle.failed(username, ip)
+                log_event('login', level=logging.WARNING, username=username, success=False)
                 flash('用户名或密码错误。', 'danger')
         return render_template('login.html', form=form)
 
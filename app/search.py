@@ -0,0 +1,72 @@
+from sqlalchemy import or_, select
+
+from . import db
+from .cache import reference_data
+from .models import Medicine, Customer, Sale
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+MIN_SUBSTRING = 3  # 少于 3 个字符只做前缀匹配
+
+
+def clamp_limit(limit):
+    return max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+
+
+def _search_names(model, q, limit):
+    # 前缀匹配走 name 索引；不足 limit 条时再补子串匹配
+    stmt = select(model.id, model.name).order_by(model.name, model.id).limit(limit)
+    rows = db.session.execute(stmt.where(model.name.startswith(q, autoescape=True)) if q else stmt).all()
+    if q and len(rows) < limit and len(q) >= MIN_SUBSTRING:
+        seen = [row.id for row in rows]
+        more = stmt.where(model.name.contains(q, autoescape=True)).limit(limit - len(rows))
+        if seen:
+            more = more.where(model.id.notin_(seen))
+        rows += db.session.execute(more).all()
+    return [{'id': row.id, 'label': row.name} for row in rows]
+
+
+def search_medicines(q, limit=DEFAULT_LIMIT):
+    q, limit = q.strip(), clamp_limit(limit)
+    return reference_data.get(('medicines', q, limit), ('medicines',),
+                              lambda: _search_names(Medicine, q, limit))
+
+
+def search_customers(q, limit=DEFAULT_LIMIT):
+    q, limit = q.strip(), clamp_limit(limit)
+    return reference_data.get(('customers', q, limit), ('customers',),
+                              lambda: _search_names(Customer, q, limit))
+
+
+def sale_label(sale_id, name, sale_date, quantity):
+    return f"#{sale_id} {name} - {sale_date} - {quantity} sold"
+
+
+def search_sales(q='', customer_id=None, medicine_id=None, start=None, end=None, limit=DEFAULT_LIMIT):
+    """Most recent sales first, filtered by customer, medicine, date window and name prefix or sale id (``#12`` for the id only)."""
+    stmt = select(Sale.id, Medicine.name, Customer.name.label('customer'), Sale.sale_date, Sale.quantity) \
+        .join(Medicine, Sale.medicine_id == Medicine.id) \
+        .outerjoin(Customer, Sale.customer_id == Customer.id)
+    if customer_id:
+        stmt = stmt.where(Sale.customer_id == customer_id)
+    if medicine_id:
+        stmt = stmt.where(Sale.medicine_id == medicine_id)
+    if start:
+        stmt = stmt.where(Sale.sale_date >= start)
+    if end:
+        stmt = stmt.where(Sale.sale_date <= end)
+    q = q.strip()
+    order = [Sale.sale_date.desc(), Sale.id.desc()]
+    if q.startswith('#') and q[1:].isdigit():
+        stmt = stmt.where(Sale.id == int(q[1:]))
+    elif q:
+        match = or_(Medicine.name.startswith(q, autoescape=True), Customer.name.startswith(q, autoescape=True))
+        if q.isdigit():
+            # 纯数字既可能是单号也可能是名称开头（如 “999感冒灵”）：两者都匹配，单号排在最前
+            match = or_(match, Sale.id == int(q))
+            order.insert(0, (Sale.id == int(q)).desc())
+        stmt = stmt.where(match)
+    stmt = stmt.order_by(*order).limit(clamp_limit(limit))
+    return [{'id': row.id, 'label': sale_label(row.id, row.name, row.sale_date, row.quantity),
+             'customer': row.customer, 'sale_date': row.sale_date.isoformat(), 'quantity': row.quantity}
+            for row in db.session.execute(stmt)]
@@ -0,0 +1,195 @@
+from datetime import date
+
+from sqlalchemy import case, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db, analytics, dashboard, financials, ledger, reorder
+from .models import Medicine, Customer, Order, Purchase, Sale, Return, Inventory
+
+
+class ServiceError(Exception):
+    """A business rule rejected the operation; the message is shown to the user."""
+
+
+def _execute(stmt):
+    return db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def adjust_stock(medicine_id, change):
+    # 原子条件更新：库存不足时 rowcount 为 0，并发结账不会超卖
+    stmt = update(Medicine).where(Medicine.id == medicine_id) \
+        .values(stock=Medicine.stock + change)
+    if change < 0:
+        stmt = stmt.where(Medicine.stock >= -change)
+    if not _execute(stmt).rowcount:
+        raise ServiceError('库存不足。' if change < 0 else '未找到药品。')
+
+
+def _check_customer(customer_id):
+    if customer_id is not None and db.session.get(Customer, customer_id) is None:
+        raise ServiceError('未找到客户。')
+
+
+def take_stock(quantities):
+    """Decrement several medicines in one UPDATE; all-or-nothing on insufficient stock."""
+    delta = case(quantities, value=Medicine.id)
+    stmt = update(Medicine).where(Medicine.id.in_(quantities), Medicine.stock >= delta) \
+        .values(stock=Medicine.stock - delta)
+    if _execute(stmt).rowcount != len(quantities):
+        raise ServiceError('库存不足。')
+
+
+def add_stock(quantities):
+    delta = case(quantities, value=Medicine.id)
+    _execute(update(Medicine).where(Medicine.id.in_(quantities)).values(stock=Medicine.stock + delta))
+
+
+def _update_inventory(changes):
+    delta = case(changes, value=Inventory.medicine_id)
+    return _execute(update(Inventory).where(Inventory.medicine_id.in_(changes))
+                    .values(quantity=Inventory.quantity + delta, last_updated=date.today())).rowcount
+
+
+def adjust_inventory_many(changes):
+    if _update_inventory(changes) == len(changes):
+        return
+    existing = set(db.session.scalars(select(Inventory.medicine_id).where(Inventory.medicine_id.in_(changes))))
+    missing = {medicine_id: change for medicine_id, change in changes.items() if medicine_id not in existing}
+    try:
+        with db.session.begin_nested():
+            # 调用方已先更新 medicines.stock，新建的库存行直接取调整后的 stock，而不是只记本次变动量
+            db.session.execute(insert(Inventory).from_select(
+                ['medicine_id', 'quantity', 'last_updated'],
+                select(Medicine.id, Medicine.stock, literal(date.today())).where(Medicine.id.in_(missing))))
+    except IntegrityError:
+        _update_inventory(missing)
+
+
+def adjust_inventory(medicine_id, change):
+    adjust_inventory_many({medicine_id: change})
+
+
+def _commit_or_rollback(operation):
+    try:
+        result = operation()
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def create_medicine(**fields):
+    def operation():
+        medicine = Medicine(**fields)
+        medicine.opening_stock = medicine.stock
+        db.session.add(medicine)
+        db.session.flush()
+        adjust_inventory(medicine.id, medicine.stock)
+        ledger.record_movement(medicine.id, medicine.stock, 'opening', date.today())
+        return medicine
+    return _commit_or_rollback(operation)
+
+
+def record_sale(medicine_id, customer_id, quantity, sale_date):
+    def operation():
+        price = db.session.execute(select(Medicine.price).where(Medicine.id == medicine_id)).scalar()
+        if price is None:
+            raise ServiceError('未找到药品。')
+        _check_customer(customer_id)
+        adjust_stock(medicine_id, -quantity)
+        adjust_inventory(medicine_id, -quantity)
+
+        total_price = price * quantity
+        sale = Sale(medicine_id=medicine_id, customer_id=customer_id, quantity=quantity,
+                    sale_date=sale_date, unit_price=price, total_price=total_price)
+        db.session.add(sale)
+        db.session.flush()
+        ledger.record_movement(medicine_id, -quantity, 'sale', sale_date, sale.id)
+        reorder.record_sales(sale_date, {medicine_id: quantity})
+        analytics.touch(sale_date)
+        dashboard.bump(sale_date, sales=total_price, stock_value=-total_price)
+        financials.record(sale_date, sales=total_price)
+        return sale
+    return _commit_or_rollback(operation)
+
+
+def record_order(customer_id, order_date, items):
+    """Check out a basket of ``(medicine_id, quantity)`` lines as one order."""
+    def operation():
+        quantities = {}
+        for medicine_id, quantity in items:
+            quantities[medicine_id] = quantities.get(medicine_id, 0) + quantity
+        if not quantities:
+            raise ServiceError('请至少添加一种药品。')
+
+        prices = dict(db.session.execute(select(Medicine.id, Medicine.price).where(Medicine.id.in_(quantities))).all())
+        if len(prices) != len(quantities):
+            raise ServiceError('未找到药品。')
+        _check_customer(customer_id)
+        take_stock(quantities)
+        adjust_inventory_many({medicine_id: -quantity for medicine_id, quantity in quantities.items()})
+
+        lines = [{'medicine_id': medicine_id, 'customer_id': customer_id, 'quantity': quantity,
+                  'sale_date': order_date, 'unit_price': prices[medicine_id],
+                  'total_price': prices[medicine_id] * quantity}
+                 for medicine_id, quantity in quantities.items()]
+        total_price = sum(line['total_price'] for line in lines)
+        order = Order(customer_id=customer_id, order_date=order_date, total_price=total_price)
+        db.session.add(order)
+        db.session.flush()
+        # 明细行用 executemany 批量插入，汇总只更新一次
+        db.session.execute(insert(Sale), [dict(line, order_id=order.id) for line in lines])
+        ledger.record([(medicine_id, -quantity, 'order', order_date, order.id)
+                       for medicine_id, quantity in quantities.items()])
+        reorder.record_sales(order_date, quantities)
+        analytics.touch(order_date)
+        dashboard.bump(order_date, sales=total_price, stock_value=-total_price)
+        financials.record(order_date, sales=total_price)
+        return order
+    return _commit_or_rollback(operation)
+
+
+def record_purchase(medicine_id, supplier_id, quantity, purchase_date):
+    def operation():
+        # 先更新库存：药品不存在时在这里报 ServiceError，而不是在 autoflush 插入采购时撞上外键约束
+        adjust_stock(medicine_id, quantity)
+        adjust_inventory(medicine_id, quantity)
+        purchase = Purchase(medicine_id=medicine_id, supplier_id=supplier_id, quantity=quantity,
+                            purchase_date=purchase_date)
+        db.session.add(purchase)
+        db.session.flush()
+        ledger.record_movement(medicine_id, quantity, 'purchase', purchase_date, purchase.id)
+        return purchase
+    return _commit_or_rollback(operation)
+
+
+def record_return(sale_id, quantity, return_date):
+    """Book a return against a sale; returns ``(return, refund_amount)``."""
+    def operation():
+        sale = db.session.get(Sale, sale_id, with_for_update=True)
+        if sale is None:
+            raise ServiceError('未找到销售记录。')
+        if sale.quantity < quantity:
+            raise ServiceError('退货数量超过销售数量。')
+        medicine = sale.medicine
+        if medicine is None:
+            raise ServiceError('未找到药品。')
+
+        # 按成交单价退款，与之后的药品调价无关
+        refund_amount = financials.return_value(sale, quantity)
+        financials.record(return_date, returns=refund_amount)
+
+        new_return = Return(sale_id=sale_id, quantity=quantity, return_date=return_date, refund_amount=refund_amount)
+        db.session.add(new_return)
+        sale.quantity -= quantity
+        adjust_stock(sale.medicine_id, quantity)
+        adjust_inventory(sale.medicine_id, quantity)
+        db.session.flush()
+        ledger.record_movement(sale.medicine_id, quantity, 'return', return_date, new_return.id)
+        # 退货从原销售日期的销量中扣除，避免压低退货当天的销售速度
+        reorder.record_sales(sale.sale_date, {sale.medicine_id: -quantity})
+        analytics.touch(sale.sale_date, return_date)
+        dashboard.bump(return_date, returns=refund_amount, stock_value=medicine.price * quantity)
+        return new_return, refund_amount
+    return _commit_or_rollback(operation)
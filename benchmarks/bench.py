@@ -0,0 +1,195 @@
+"""Benchmark the main sales/inventory pages through the Flask test client.
+
+Usage::
+
+    python -m benchmarks.bench --database-url sqlite:///bench.db --generate --scale 0.01
+    python -m benchmarks.bench --database-url sqlite:///bench.db --output after.json --compare before.json
+
+Each scenario is issued ``--iterations`` times; latency percentiles,
+queries per request and the process peak RSS are printed and optionally
+saved as JSON so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, func
+
+BENCH_USER = ('benchmark', 'benchmark')
+
+
+def _percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS 返回字节
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _scenarios(ctx):
+    rng = ctx['rng']
+    today = date.today().isoformat()
+
+    def add_sale(client):
+        return client.post('/add_sale', data={
+            'medicine_id': rng.randint(1, ctx['medicines']),
+            'customer_id': rng.randint(1, ctx['customers']),
+            'quantity': rng.randint(1, 3),
+            'sale_date': today,
+        })
+
+    def process_return(client):
+        return client.post('/returns', data={
+            'sale_id': rng.randint(1, ctx['sales']),
+            'quantity': 1,
+            'return_date': today,
+        })
+
+    def list_sales(client):
+        return client.get('/sales')
+
+    def financial_report(client):
+        return client.get('/financial_report')
+
+    def inventory_report(client):
+        return client.get('/inventory_report')
+
+    return [add_sale, process_return, list_sales, financial_report, inventory_report]
+
+
+def run(app, iterations, seed=0, echo=print):
+    from app import db
+    from app.models import Medicine, Customer, Sale
+    from benchmarks.datagen import ensure_user
+
+    with app.app_context():
+        ensure_user(*BENCH_USER)
+        ctx = {
+            'rng': random.Random(seed),
+            'medicines': db.session.query(func.max(Medicine.id)).scalar() or 1,
+            'customers': db.session.query(func.max(Customer.id)).scalar() or 1,
+            'sales': db.session.query(func.max(Sale.id)).scalar() or 1,
+        }
+        engine = db.engine
+
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    client = app.test_client()
+    client.post('/login', data={'username': BENCH_USER[0], 'password': BENCH_USER[1]})
+
+    results = {}
+    try:
+        for scenario in _scenarios(ctx):
+            latencies, statuses = [], {}
+            queries[0] = 0
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = scenario(client)
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            p50, p95, p99 = _percentiles(latencies)
+            results[scenario.__name__] = {
+                'requests': iterations,
+                'p50_ms': round(p50, 3),
+                'p95_ms': round(p95, 3),
+                'p99_ms': round(p99, 3),
+                'mean_ms': round(statistics.fmean(latencies), 3),
+                'queries_per_request': round(queries[0] / iterations, 2),
+                'statuses': {str(k): v for k, v in sorted(statuses.items())},
+            }
+            echo(f"{scenario.__name__:<18} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms  "
+                 f"{queries[0] / iterations:6.1f} q/req")
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return results
+
+
+def compare(current, previous, echo=print):
+    echo('\nvs. previous run:')
+    for name, result in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        parts = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            if before.get(key):
+                parts.append(f'{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%')
+        echo(f'{name:<18} ' + '  '.join(parts))
+    if previous.get('peak_rss_kb'):
+        change = (current['peak_rss_kb'] - previous['peak_rss_kb']) / previous['peak_rss_kb'] * 100
+        echo(f'{"peak_rss_kb":<18} {change:+.1f}%')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--generate', action='store_true', help='create tables and load synthetic data first')
+    parser.add_argument('--scale', type=float, default=1.0, help='fraction of the full volumes to generate')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import create_app, db
+    from benchmarks import datagen
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, PROFILER_FOOTER=False)
+    if args.generate:
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            datagen.generate(scale=args.scale, years=args.years, seed=args.seed)
+            print(f'generated in {time.perf_counter() - started:.1f}s')
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': _git_revision(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+        },
+        'scenarios': run(app, args.iterations, seed=args.seed),
+        'peak_rss_kb': _peak_rss_kb(),
+    }
+    print(f"peak RSS {results['peak_rss_kb']} KB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Synthetic data for the sales/inventory workload.
+
+Rows are generated in batches and written with executemany inserts, so
+memory stays flat even for millions of sales. Every ``RETURN_EVERY``-th
+sale gets one returned unit, and the stored sale quantity is the
+remaining quantity, matching what process_return leaves behind.
+
+Each medicine starts with ``OPENING_STOCK`` units; every opening stock,
+purchase, sale and return also gets its ``stock_movements`` row, and the
+final stock and inventory are set from those movements, so
+``flask reconcile-inventory`` finds a generated database consistent. The
+financial and sales-velocity rollups are rebuilt and stock snapshots are
+taken every ``SNAPSHOT_DAYS`` days, as the nightly commands would.
+"""
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import bindparam, insert, update
+
+from app import db, financials, ledger, reorder
+from app.models import Supplier, Medicine, Customer, Purchase, Sale, Return, Inventory, StockMovement, User
+
+BATCH = 10000
+OPENING_STOCK = 1000000
+SNAPSHOT_DAYS = 30
+RETURN_EVERY = 10
+
+VOLUMES = {
+    'suppliers': 200,
+    'medicines': 10000,
+    'customers': 20000,
+    'purchases': 200000,
+    'sales': 1000000,
+}
+
+
+def _batched(rows, size=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _write(model, rows):
+    count = 0
+    for batch in _batched(rows):
+        db.session.execute(insert(model), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+def generate(scale=1.0, years=3, seed=42, echo=print):
+    rng = random.Random(seed)
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+    span = (today - first_day).days
+    n = {name: max(1, int(count * scale)) for name, count in VOLUMES.items()}
+
+    def some_day():
+        return first_day + timedelta(days=rng.randrange(span + 1))
+
+    _write(Supplier, ({'id': i, 'name': f'供应商 {i}', 'contact_info': f'021-{i:08d}'}
+                      for i in range(1, n['suppliers'] + 1)))
+    prices = {i: Decimal(rng.randrange(100, 50000)) / 100 for i in range(1, n['medicines'] + 1)}
+    stock = dict.fromkeys(prices, OPENING_STOCK)  # 按流水累计，最后写回 medicines.stock 和 inventory
+    created_at = datetime.now()
+
+    def movement(medicine_id, delta, kind, movement_date, reference_id=None):
+        return {'medicine_id': medicine_id, 'delta': delta, 'kind': kind, 'movement_date': movement_date,
+                'reference_id': reference_id, 'created_at': created_at}
+
+    for batch in _batched(range(1, n['medicines'] + 1)):
+        db.session.execute(insert(Medicine), [
+            {'id': i, 'name': f'药品 {i:05d}', 'description': '', 'price': prices[i], 'stock': OPENING_STOCK,
+             'opening_stock': OPENING_STOCK, 'supplier_id': rng.randint(1, n['suppliers'])} for i in batch])
+        db.session.execute(insert(StockMovement), [movement(i, OPENING_STOCK, 'opening', first_day) for i in batch])
+        db.session.commit()
+    _write(Customer, ({'id': i, 'name': f'客户 {i:06d}', 'contact_info': '', 'address': ''}
+                      for i in range(1, n['customers'] + 1)))
+    for batch in _batched(range(1, n['purchases'] + 1)):
+        purchase_rows = [{'id': i, 'medicine_id': rng.randint(1, n['medicines']), 'quantity': rng.randint(10, 500),
+                          'purchase_date': some_day(), 'supplier_id': rng.randint(1, n['suppliers'])} for i in batch]
+        for row in purchase_rows:
+            stock[row['medicine_id']] += row['quantity']
+        db.session.execute(insert(Purchase), purchase_rows)
+        db.session.execute(insert(StockMovement), [
+            movement(row['medicine_id'], row['quantity'], 'purchase', row['purchase_date'], row['id'])
+            for row in purchase_rows])
+        db.session.commit()
+    echo(f"reference data: {n['suppliers']} suppliers, {n['medicines']} medicines, "
+         f"{n['customers']} customers, {n['purchases']} purchases")
+
+    sales = returns = 0
+    for start in range(1, n['sales'] + 1, BATCH):
+        sale_rows, return_rows, movements = [], [], []
+        for sale_id in range(start, min(start + BATCH, n['sales'] + 1)):
+            medicine_id = rng.randint(1, n['medicines'])
+            quantity = rng.randint(1, 5)
+            sale_date = some_day()
+            returned = 0
+            if sale_id % RETURN_EVERY == 0:
+                quantity, returned = max(quantity, 2), 1
+                return_id = sale_id // RETURN_EVERY
+                return_date = min(today, sale_date + timedelta(days=rng.randrange(31)))
+                return_rows.append({'id': return_id, 'sale_id': sale_id, 'quantity': returned,
+                                    'refund_amount': prices[medicine_id], 'return_date': return_date})
+            # 流水与 services 一致：销售按原始数量出库，退货另记一笔入库
+            movements.append(movement(medicine_id, -quantity, 'sale', sale_date, sale_id))
+            if returned:
+                movements.append(movement(medicine_id, returned, 'return', return_date, return_id))
+            kept = quantity - returned
+            stock[medicine_id] -= kept
+            sale_rows.append({'id': sale_id, 'medicine_id': medicine_id,
+                              'customer_id': rng.randint(1, n['customers']),
+                              'quantity': kept,
+                              'sale_date': sale_date, 'unit_price': prices[medicine_id],
+                              'total_price': prices[medicine_id] * quantity})
+        db.session.execute(insert(Sale), sale_rows)
+        if return_rows:
+            db.session.execute(insert(Return), return_rows)
+        db.session.execute(insert(StockMovement), movements)
+        db.session.commit()
+        sales += len(sale_rows)
+        returns += len(return_rows)
+        if sales % (BATCH * 10) == 0:
+            echo(f'{sales} sales, {returns} returns')
+    echo(f'{sales} sales, {returns} returns')
+
+    # 期初 + 进货 - 销售（已扣除退货）
+    for batch in _batched(stock.items()):
+        db.session.execute(update(Medicine.__table__).where(Medicine.id == bindparam('m_id'))
+                           .values(stock=bindparam('m_stock')),
+                           [{'m_id': medicine_id, 'm_stock': quantity} for medicine_id, quantity in batch])
+        db.session.execute(insert(Inventory), [{'medicine_id': medicine_id, 'quantity': quantity,
+                                                'last_updated': today} for medicine_id, quantity in batch])
+        db.session.commit()
+
+    drift = financials.rebuild(repair=True)
+    echo(f'financial rollups: {len(drift)} rows written')
+    echo(f'sales velocity rollup: {reorder.rebuild()} rows written')
+    # 每 SNAPSHOT_DAYS 天一次快照，另加昨天（snapshot-stock 的默认日期），让 stock_on 有快照可用
+    yesterday = today - timedelta(days=1)
+    days = [first_day + timedelta(days=d) for d in range(SNAPSHOT_DAYS, (yesterday - first_day).days, SNAPSHOT_DAYS)]
+    snapshots = sum(ledger.take_snapshots(day) for day in days + [yesterday])
+    echo(f'stock snapshots: {snapshots} rows written for {len(days) + 1} days')
+
+
+def ensure_user(username, password):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        user = User(username=username, is_admin=True)
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+    return user
@@ -0,0 +1,135 @@
+"""Check with EXPLAIN that the report and search queries use their indexes.
+
+Usage::
+
+    python -m benchmarks.indexes
+    python -m benchmarks.indexes --database-url mysql+pymysql://user:pw@localhost/bench
+
+Each check runs the application's own code path (the sales report
+analytics, exports, inventory updates, typeahead search), captures the
+first statement it sends and prints the database's plan for it. The
+command exits with status 1 when a plan does not use the expected index.
+Without ``--database-url`` a temporary SQLite database is filled with a
+small synthetic data set; point it at a database generated with
+``benchmarks.bench --generate`` so MySQL's optimiser sees realistic
+table sizes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+
+class Check:
+    def __init__(self, label, run, indexes, dialects=None):
+        self.label = label
+        self.run = run  # 在应用上下文中执行被检查的代码
+        self.indexes = indexes  # 计划里出现其中任一名称即通过
+        self.dialects = dialects  # None 表示所有数据库
+
+
+def _checks():
+    from app import analytics, export, search, services
+    from app.models import Customer, Medicine
+
+    end = date.today()
+    start = end - timedelta(days=29)
+    sales_index = ('ix_sales_sale_date_medicine_id',)
+    return [
+        Check('sales report: top medicines', lambda: analytics.top_medicines(start, end), sales_index),
+        Check('sales report: top customers', lambda: analytics.top_customers(start, end), sales_index),
+        Check('sales report: return rates', lambda: analytics.return_rates(start, end), sales_index),
+        Check('export sales by date', lambda: _export('sales', start, end), sales_index),
+        Check('export returns by date', lambda: _export('returns', start, end),
+              ('ix_returns_return_date_sale_id',)),
+        Check('export purchases by date', lambda: _export('purchases', start, end),
+              ('ix_purchases_purchase_date_medicine_id',)),
+        # SQLite 给唯一约束建的是自动命名的索引
+        Check('inventory update by medicine', lambda: services.adjust_inventory(1, 0),
+              ('uq_inventory_medicine_id', 'sqlite_autoindex_inventory')),
+        # SQLite 的 LIKE 默认不区分大小写，不能用普通索引做前缀匹配；PostgreSQL 需要 text_pattern_ops
+        Check('medicine typeahead', lambda: search._search_names(Medicine, '药品', search.DEFAULT_LIMIT),
+              ('ix_medicines_name',), dialects=('mysql',)),
+        Check('customer typeahead', lambda: search._search_names(Customer, '客户', search.DEFAULT_LIMIT),
+              ('ix_customers_name',), dialects=('mysql',)),
+    ]
+
+
+def _export(name, start, end):
+    from app import db, export
+
+    db.session.execute(export.build_query(name, start=start, end=end)).all()
+
+
+def explain(app, check):
+    """Return the plan of the first statement ``check`` sends, as text."""
+    from app import analytics, db
+
+    with app.app_context():
+        analytics.reports.clear()
+        connection = db.session.connection()
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'WITH')):
+                statements.append((statement, parameters))
+
+        event.listen(connection, 'before_cursor_execute', capture)
+        try:
+            check.run()
+        finally:
+            event.remove(connection, 'before_cursor_execute', capture)
+        try:
+            if not statements:
+                return ''
+            statement, parameters = statements[0]
+            prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+            rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+            return '\n'.join(' | '.join(str(value) for value in row) for row in rows)
+        finally:
+            db.session.rollback()  # 库存更新等检查不留下改动
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='existing database at the latest migration; default: a temporary SQLite file')
+    parser.add_argument('--scale', type=float, default=0.001, help='data volume for the temporary database')
+    parser.add_argument('--verbose', '-v', action='store_true', help='print every plan, not only failures')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tmp, 'indexes.db')}"
+        os.environ.setdefault('LOG_FILE', os.path.join(tmp, 'app.log'))
+        from app import create_app, db
+
+        app = create_app()
+        with app.app_context():
+            dialect = db.engine.dialect.name
+            if not args.database_url:
+                from benchmarks.datagen import generate
+
+                db.create_all()
+                generate(scale=args.scale, years=1, echo=lambda *a: None)
+
+        failed = 0
+        for check in _checks():
+            if check.dialects and dialect not in check.dialects:
+                print(f'SKIP     {check.label} (not checked on {dialect})')
+                continue
+            plan = explain(app, check)
+            ok = any(index in plan for index in check.indexes)
+            failed += not ok
+            print(f"{'OK' if ok else 'MISSING':8} {check.label}: {' / '.join(check.indexes)}")
+            if args.verbose or not ok:
+                print('    ' + (plan.replace('\n', '\n    ') or '(no statement captured)'))
+
+    print(f'{failed} check(s) without the expected index' if failed else 'all queries use their indexes')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Load-test the production server (gunicorn + wsgi.py) at several worker counts.
+
+Usage::
+
+    python -m benchmarks.load --database-url sqlite:///bench.db --workers 1 2 4 --concurrency 16
+    python -m benchmarks.load --database-url mysql+pymysql://user:pw@localhost/med_sales_db --output load.json
+
+For every worker count a server is started with ``gunicorn.conf.py``,
+``--concurrency`` client threads log in and request ``--path`` pages over
+keep-alive connections for ``--duration`` seconds, then the server is
+stopped. Throughput and latency percentiles are printed per worker count
+together with the speed-up over the first one.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+from benchmarks.bench import BENCH_USER, _git_revision, _percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATHS = ['/sales', '/inventory_report', '/financial_report', '/dashboard']
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class Client:
+    """One keep-alive connection with its own session cookie."""
+
+    def __init__(self, host, port):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        if body is not None:
+            body = urllib.parse.urlencode(body)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, data
+
+    def login(self, username, password):
+        status, page = self.request('GET', '/login')
+        match = CSRF_RE.search(page.decode('utf-8'))
+        form = {'username': username, 'password': password}
+        if match:
+            form['csrf_token'] = match.group(1)
+        status, _ = self.request('POST', '/login', form)
+        if status != 302:
+            raise RuntimeError(f'login failed with HTTP {status}')
+
+    def close(self):
+        self.conn.close()
+
+
+def _wait_for(host, port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server did not listen on {host}:{port} within {timeout}s')
+
+
+def start_server(workers, threads, host, port, env):
+    env = dict(env, WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads), BIND=f'{host}:{port}')
+    # 服务器输出写到临时文件；用管道而不读取会在缓冲区写满后卡住 worker
+    output = tempfile.TemporaryFile()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                               cwd=ROOT, env=env, stdout=output, stderr=subprocess.STDOUT)
+    process.output = output
+    try:
+        _wait_for(host, port, process)
+    except RuntimeError:
+        stop_server(process)
+        output.seek(0)
+        sys.stderr.write(output.read()[-4000:].decode('utf-8', 'replace'))
+        raise
+    return process
+
+
+def stop_server(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    process.output.close()
+
+
+def drive(host, port, paths, concurrency, duration, warmup=2.0):
+    """Hammer the server from ``concurrency`` threads; returns (requests/s, latencies in ms, statuses)."""
+    clients = []
+    for _ in range(concurrency):
+        client = Client(host, port)
+        client.login(*BENCH_USER)
+        clients.append(client)
+
+    lock = threading.Lock()
+    latencies, statuses, errors = [], {}, [0]
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def work(client, offset):
+        i = offset
+        own_latencies, own_statuses = [], {}
+        while True:
+            before = time.monotonic()
+            if before >= stop_at:
+                break
+            try:
+                status, _ = client.request('GET', paths[i % len(paths)])
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                client.close()
+                continue
+            i += 1
+            if before >= measure_from:
+                own_latencies.append((time.monotonic() - before) * 1000)
+                own_statuses[status] = own_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(own_latencies)
+            for status, count in own_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=work, args=(client, n)) for n, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.close()
+    if errors[0]:
+        statuses['error'] = errors[0]
+    return len(latencies) / duration, latencies, statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='client connections')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds measured per worker count')
+    parser.add_argument('--path', dest='paths', action='append', help='page to request (repeatable)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+    paths = args.paths or DEFAULT_PATHS
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import create_app
+    from benchmarks.datagen import ensure_user
+
+    app = create_app()
+    with app.app_context():
+        ensure_user(*BENCH_USER)
+
+    env = dict(os.environ, DATABASE_URL=args.database_url, PROFILER_FOOTER='0')
+    results = []
+    for workers in args.workers:
+        process = start_server(workers, args.threads, args.host, args.port, env)
+        try:
+            throughput, latencies, statuses = drive(args.host, args.port, paths, args.concurrency, args.duration)
+        finally:
+            stop_server(process)
+        p50, p95, p99 = _percentiles(latencies)
+        result = {
+            'workers': workers,
+            'threads': args.threads,
+            'requests_per_second': round(throughput, 1),
+            'p50_ms': round(p50, 3),
+            'p95_ms': round(p95, 3),
+            'p99_ms': round(p99, 3),
+            'mean_ms': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+            'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        }
+        results.append(result)
+        speedup = throughput / results[0]['requests_per_second'] if results[0]['requests_per_second'] else 0
+        print(f"{workers:>3} workers  {throughput:8.1f} req/s  x{speedup:4.2f}  "
+              f"p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms  {result['statuses']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'timestamp': datetime.now().isoformat(timespec='seconds'),
+                    'revision': _git_revision(),
+                    'database': args.database_url.split('@')[-1],
+                    'cpus': os.cpu_count(),
+                    'concurrency': args.concurrency,
+                    'duration': args.duration,
+                    'paths': paths,
+                },
+                'runs': results,
+            }, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Stress-test concurrent checkouts against one medicine for overselling and time them.
+
+Usage::
+
+    python -m benchmarks.oversell --threads 32 --stock 10
+    python -m benchmarks.oversell --threads 16 --per-thread 20 --stock 10000 --baseline
+    python -m benchmarks.oversell --database-url mysql+pymysql://user:pw@localhost/med_sales_db --threads 64
+
+A new medicine with ``--stock`` units is created, then ``--threads``
+threads released together each try ``--per-thread`` times to sell one
+unit, alternating between single sales and one-line orders. Exactly
+``min(stock, attempts)`` must succeed and stock, inventory and the stock
+ledger must all end at the units left; otherwise the command exits with
+status 1. Wall time, successful checkouts per second and attempts per
+second are printed.
+
+``--baseline`` repeats the race on a second medicine with the original
+read-check-write code (load the medicine, compare stock in Python,
+decrement, then update inventory and recompute the day's financials in
+separate commits) and prints its throughput and oversell next to the
+current path. Without ``--database-url`` a temporary SQLite database is
+used, which serialises writers and so only checks the bookkeeping; run it
+against MySQL to exercise the row-level race.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+from sqlalchemy import func, select
+
+
+class RaceResult:
+    def __init__(self, label, attempts, stock):
+        self.label = label
+        self.attempts = attempts
+        self.stock = stock
+        self.succeeded = 0
+        self.rejected = 0
+        self.errors = []
+        self.seconds = 0.0
+        self.final_stock = self.inventory = self.ledger = None
+
+    @property
+    def per_second(self):
+        return self.succeeded / self.seconds if self.seconds else 0.0
+
+    @property
+    def oversold(self):
+        return max(self.succeeded - self.stock, 0)
+
+
+def checkout(medicine_id, customer_id, n):
+    """The current path: one transaction with a conditional stock UPDATE."""
+    from app import services
+
+    if n % 2:
+        services.record_order(customer_id, date.today(), [(medicine_id, 1)])
+    else:
+        services.record_sale(medicine_id, customer_id, 1, date.today())
+
+
+def legacy_checkout(medicine_id, customer_id, n):
+    """The original add_sale: read the stock, check it in Python, write it back, then two more commits."""
+    from app import db, services
+    from app.models import Financial, Inventory, Medicine, Sale
+
+    today = date.today()
+    medicine = db.session.get(Medicine, medicine_id)
+    if medicine.stock < 1:
+        raise services.ServiceError('库存不足。')
+    db.session.add(Sale(medicine_id=medicine_id, customer_id=customer_id, quantity=1, sale_date=today,
+                        unit_price=medicine.price, total_price=medicine.price))
+    medicine.stock -= 1
+    db.session.commit()
+    inventory = db.session.execute(select(Inventory).where(Inventory.medicine_id == medicine_id)).scalar()
+    inventory.quantity -= 1
+    db.session.commit()
+    total = db.session.scalar(select(func.sum(Sale.total_price)).where(func.date(Sale.sale_date) == today)) or 0
+    financial = db.session.execute(select(Financial).where(Financial.date == today)).scalar()
+    if financial is None:
+        db.session.add(Financial(date=today, total_sales=total, net_profit=total))
+    else:
+        financial.total_sales = total
+    db.session.commit()
+
+
+def run(app, threads, stock, per_thread=1, attempt=checkout, label='current'):
+    """Race ``threads * per_thread`` single-unit checkouts for a new medicine; returns a :class:`RaceResult`."""
+    from app import db, services
+    from app.models import Customer, Inventory, Medicine, StockMovement
+
+    with app.app_context():
+        customer = Customer(name='oversell-test')
+        db.session.add(customer)
+        db.session.commit()
+        customer_id = customer.id
+        medicine_id = services.create_medicine(name=f'oversell-test-{os.getpid()}-{label}', description='',
+                                               price=1, stock=stock).id
+
+    result = RaceResult(label, threads * per_thread, stock)
+    started = []
+    barrier = threading.Barrier(threads, action=lambda: started.append(time.perf_counter()))
+    lock = threading.Lock()
+
+    def work(n):
+        with app.app_context():
+            barrier.wait()
+            for i in range(per_thread):
+                try:
+                    attempt(medicine_id, customer_id, n + i)
+                    key = 'succeeded'
+                except services.ServiceError:
+                    key = 'rejected'
+                except Exception as e:  # 死锁、锁等待超时等都算失败，需要单独报告
+                    db.session.rollback()
+                    with lock:
+                        result.errors.append(f'{e.__class__.__name__}: {e}')
+                    continue
+                with lock:
+                    if key == 'succeeded':
+                        result.succeeded += 1
+                    else:
+                        result.rejected += 1
+            db.session.remove()
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    result.seconds = time.perf_counter() - started[0]
+
+    with app.app_context():
+        result.final_stock = db.session.get(Medicine, medicine_id).stock
+        result.inventory = db.session.scalar(select(Inventory.quantity).where(Inventory.medicine_id == medicine_id))
+        result.ledger = db.session.scalar(select(func.coalesce(func.sum(StockMovement.delta), 0))
+                                          .where(StockMovement.medicine_id == medicine_id))
+    return result
+
+
+def report(result):
+    print(f'{result.label:8} {result.attempts} checkouts for {result.stock} units: {result.succeeded} succeeded, '
+          f'{result.rejected} rejected for insufficient stock, {len(result.errors)} failed, '
+          f'{result.oversold} oversold')
+    attempts = result.attempts / result.seconds if result.seconds else 0.0
+    print(f'{"":8} {result.seconds:.2f}s, {result.per_second:.1f} checkouts/s ({attempts:.1f} attempts/s); '
+          f'final stock {result.final_stock}, inventory {result.inventory}, ledger balance {result.ledger}')
+    for error in result.errors[:5]:
+        print(f'{"":10}{error}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='existing database at the latest migration; default: a temporary SQLite file')
+    parser.add_argument('--threads', type=int, default=32, help='parallel checkouts')
+    parser.add_argument('--per-thread', type=int, default=1, help='checkouts each thread attempts')
+    parser.add_argument('--stock', type=int, default=10, help='units on hand before the race')
+    parser.add_argument('--baseline', action='store_true', help='also time the original read-check-write path')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tmp, 'oversell.db')}?timeout=30"
+        os.environ.setdefault('LOG_FILE', os.path.join(tmp, 'app.log'))
+        from app import create_app, db
+
+        app = create_app()
+        if not args.database_url:
+            with app.app_context():
+                db.create_all()
+        result = run(app, args.threads, args.stock, args.per_thread)
+        baseline = run(app, args.threads, args.stock, args.per_thread, legacy_checkout, 'baseline') \
+            if args.baseline else None
+
+    report(result)
+    if baseline:
+        report(baseline)
+        if baseline.per_second:
+            print(f'current path: {result.per_second / baseline.per_second:.2f}x the baseline throughput')
+
+    sold = min(args.stock, result.attempts)
+    left = args.stock - sold
+    failed = result.errors or result.succeeded != sold or result.rejected != result.attempts - sold \
+        or (result.final_stock, result.inventory, result.ledger) != (left, left, left)
+    if failed:
+        print('oversell check FAILED')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
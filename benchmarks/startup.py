@@ -0,0 +1,73 @@
+"""Measure cold application startup (``from app import create_app; create_app()``).
+
+Usage::
+
+    python -m benchmarks.startup --runs 5 --budget-ms 800
+
+Each run is a fresh interpreter pointed at a database that cannot be
+opened, so any query during startup fails the run. The command exits with
+status 1 when the median exceeds ``--budget-ms`` or when a module that
+should be imported lazily (numpy, alembic, flask_migrate) was loaded
+during boot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ('numpy', 'alembic', 'flask_migrate')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+seconds = time.perf_counter() - started
+print(json.dumps({'ms': seconds * 1000, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (DEFERRED,)
+
+
+def measure(runs):
+    """Return ``(milliseconds per run, deferred modules seen loaded)``."""
+    timings, loaded = [], set()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   # 目录不存在，启动过程中任何数据库连接都会报错
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp, 'missing', 'startup.db'),
+                   LOG_FILE=os.path.join(tmp, 'app.log'),
+                   PYTHONDONTWRITEBYTECODE='')
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            timings.append(result['ms'])
+            loaded.update(result['loaded'])
+    return timings, sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', 800)))
+    args = parser.parse_args(argv)
+
+    timings, loaded = measure(args.runs)
+    median = statistics.median(timings)
+    print(f'startup median {median:.0f} ms  min {min(timings):.0f} ms  max {max(timings):.0f} ms  '
+          f'(budget {args.budget_ms:.0f} ms)')
+    failed = False
+    if loaded:
+        print(f'loaded during startup but should be deferred: {", ".join(loaded)}')
+        failed = True
+    if median > args.budget_ms:
+        print('startup is over budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
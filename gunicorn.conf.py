@@ -0,0 +1,20 @@
+"""gunicorn settings for ``gunicorn -c gunicorn.conf.py wsgi:app``; each value can be set from the environment."""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5001')
+# 页面耗时主要在数据库 I/O 上：多进程再加每进程若干线程
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))  # DB_POOL_SIZE 不要小于该值
+# 主进程加载一次应用后 fork；连接池和日志线程由 create_app 注册的 fork 钩子在 worker 中重建
+preload_app = True
+timeout = int(os.getenv('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# 定期替换 worker，限制长期运行的内存增长
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+# 多个 worker 各自按大小轮转同一个文件会互相覆盖，生产环境改用 logrotate（copytruncate）
+os.environ.setdefault('LOG_MAX_BYTES', '0')
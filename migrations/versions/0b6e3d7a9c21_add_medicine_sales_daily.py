@@ -0,0 +1,43 @@
+"""Add medicine_sales_daily rollup for sales velocity
+
+Revision ID: 0b6e3d7a9c21
+Revises: f1b27d94c3a8
+Create Date: 2026-10-18 17:31:06.518244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e3d7a9c21'
+down_revision = 'f1b27d94c3a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('medicine_sales_daily',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('medicine_id', 'day', name='uq_medicine_sales_daily_medicine_id_day')
+    )
+    with op.batch_alter_table('medicine_sales_daily', schema=None) as batch_op:
+        batch_op.create_index('ix_medicine_sales_daily_day', ['day'], unique=False)
+
+    # sales.quantity 已扣除退货
+    op.execute(
+        'INSERT INTO medicine_sales_daily (medicine_id, day, quantity)'
+        ' SELECT medicine_id, sale_date, SUM(quantity) FROM sales GROUP BY medicine_id, sale_date'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('medicine_sales_daily', schema=None) as batch_op:
+        batch_op.drop_index('ix_medicine_sales_daily_day')
+
+    op.drop_table('medicine_sales_daily')
@@ -0,0 +1,44 @@
+"""Store sales.unit_price and returns.refund_amount
+
+Revision ID: 2c8f4e1b7d36
+Revises: 0b6e3d7a9c21
+Create Date: 2026-10-18 17:58:22.640193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8f4e1b7d36'
+down_revision = '0b6e3d7a9c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    with op.batch_alter_table('returns', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('refund_amount', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    # sales.quantity 在退货后被扣减过，单价按原始数量 (剩余 + 已退) 反推；* 1.0 避免 SQLite 整数除法
+    op.execute(
+        'UPDATE sales SET unit_price = ROUND(total_price * 1.0 / (quantity'
+        ' + COALESCE((SELECT SUM(returns.quantity) FROM returns WHERE returns.sale_id = sales.id), 0)), 2)'
+        ' WHERE total_price IS NOT NULL AND quantity'
+        ' + COALESCE((SELECT SUM(returns.quantity) FROM returns WHERE returns.sale_id = sales.id), 0) > 0'
+    )
+    op.execute(
+        'UPDATE returns SET refund_amount = ROUND(quantity'
+        ' * (SELECT sales.unit_price FROM sales WHERE sales.id = returns.sale_id), 2)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('returns', schema=None) as batch_op:
+        batch_op.drop_column('refund_amount')
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_column('unit_price')
@@ -0,0 +1,56 @@
+"""Add total_returns to financials and monthly financial rollups
+
+Revision ID: 5c1e7a9d2b40
+Revises: 388a1b4f923b
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7a9d2b40'
+down_revision = '388a1b4f923b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('financials', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_returns', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    # 旧数据中 net_profit = total_sales - 退货额
+    op.execute('UPDATE financials SET total_returns = COALESCE(total_sales, 0) - COALESCE(net_profit, 0)')
+
+    op.create_table('financials_monthly',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('total_sales', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('total_purchases', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('total_returns', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('net_profit', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('month')
+    )
+    # 由已有的日汇总回填月汇总；之后的销售/退货按增量累加到这些行上
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        month = "date(date, 'start of month')"
+    elif dialect == 'postgresql':
+        month = "CAST(date_trunc('month', date) AS DATE)"
+    else:
+        month = 'DATE_SUB(date, INTERVAL DAYOFMONTH(date) - 1 DAY)'
+    op.execute(
+        'INSERT INTO financials_monthly (month, total_sales, total_purchases, total_returns, net_profit)'
+        f' SELECT {month}, SUM(COALESCE(total_sales, 0)), SUM(COALESCE(total_purchases, 0)),'
+        ' SUM(COALESCE(total_returns, 0)), SUM(COALESCE(net_profit, 0))'
+        f' FROM financials GROUP BY {month}'
+    )
+
+
+def downgrade():
+    op.drop_table('financials_monthly')
+
+    with op.batch_alter_table('financials', schema=None) as batch_op:
+        batch_op.drop_column('total_returns')
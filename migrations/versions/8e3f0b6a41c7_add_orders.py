@@ -0,0 +1,41 @@
+"""Add orders and sales.order_id for multi-line checkout
+
+Revision ID: 8e3f0b6a41c7
+Revises: 5c1e7a9d2b40
+Create Date: 2026-10-18 11:03:27.518903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f0b6a41c7'
+down_revision = '5c1e7a9d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('order_date', sa.Date(), nullable=False),
+    sa.Column('total_price', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('order_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_sales_order_id'), ['order_id'], unique=False)
+        batch_op.create_foreign_key('sales_order_id_fkey', 'orders', ['order_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_constraint('sales_order_id_fkey', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_sales_order_id'))
+        batch_op.drop_column('order_id')
+
+    op.drop_table('orders')
@@ -0,0 +1,53 @@
+"""Add composite indexes for report filters and unique inventory.medicine_id
+
+Revision ID: a7d24c19e653
+Revises: 8e3f0b6a41c7
+Create Date: 2026-10-18 11:48:05.930217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d24c19e653'
+down_revision = '8e3f0b6a41c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 删除重复的库存行，保留 id 最小的一行（旧代码 filter_by(...).first() 更新的就是它），
+    # 数量可随后用库存核对任务重新计算
+    conn = op.get_bind()
+    duplicates = conn.execute(sa.text(
+        'SELECT medicine_id, MIN(id) FROM inventory GROUP BY medicine_id HAVING COUNT(*) > 1')).all()
+    for medicine_id, keep_id in duplicates:
+        conn.execute(sa.text('DELETE FROM inventory WHERE medicine_id = :medicine_id AND id <> :keep_id'),
+                     {'medicine_id': medicine_id, 'keep_id': keep_id})
+
+    with op.batch_alter_table('inventory', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_inventory_medicine_id', ['medicine_id'])
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.create_index('ix_sales_sale_date_medicine_id', ['sale_date', 'medicine_id'], unique=False)
+
+    with op.batch_alter_table('returns', schema=None) as batch_op:
+        batch_op.create_index('ix_returns_return_date_sale_id', ['return_date', 'sale_id'], unique=False)
+
+    with op.batch_alter_table('purchases', schema=None) as batch_op:
+        batch_op.create_index('ix_purchases_purchase_date_medicine_id', ['purchase_date', 'medicine_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('purchases', schema=None) as batch_op:
+        batch_op.drop_index('ix_purchases_purchase_date_medicine_id')
+
+    with op.batch_alter_table('returns', schema=None) as batch_op:
+        batch_op.drop_index('ix_returns_return_date_sale_id')
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_index('ix_sales_sale_date_medicine_id')
+
+    with op.batch_alter_table('inventory', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_inventory_medicine_id', type_='unique')
@@ -0,0 +1,32 @@
+"""Add name indexes on medicines and customers for typeahead search
+
+Revision ID: c3b9f5e8d172
+Revises: a7d24c19e653
+Create Date: 2026-10-18 12:36:52.184470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3b9f5e8d172'
+down_revision = 'a7d24c19e653'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_medicines_name'), ['name'], unique=False)
+
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_customers_name'), ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_customers_name'))
+
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_medicines_name'))
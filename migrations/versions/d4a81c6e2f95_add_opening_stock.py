@@ -0,0 +1,45 @@
+"""Add medicines.opening_stock and medicine_id/quantity indexes for inventory reconciliation
+
+Revision ID: d4a81c6e2f95
+Revises: c3b9f5e8d172
+Create Date: 2026-10-18 16:52:13.402518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a81c6e2f95'
+down_revision = 'c3b9f5e8d172'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('opening_stock', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.create_index('ix_sales_medicine_id_quantity', ['medicine_id', 'quantity'], unique=False)
+
+    with op.batch_alter_table('purchases', schema=None) as batch_op:
+        batch_op.create_index('ix_purchases_medicine_id_quantity', ['medicine_id', 'quantity'], unique=False)
+
+    # 以当前 stock 为准反推初始库存: stock - 采购 + 销售（sales.quantity 已扣除退货）
+    op.execute(
+        'UPDATE medicines SET opening_stock = stock'
+        ' - COALESCE((SELECT SUM(quantity) FROM purchases WHERE purchases.medicine_id = medicines.id), 0)'
+        ' + COALESCE((SELECT SUM(quantity) FROM sales WHERE sales.medicine_id = medicines.id), 0)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('purchases', schema=None) as batch_op:
+        batch_op.drop_index('ix_purchases_medicine_id_quantity')
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_index('ix_sales_medicine_id_quantity')
+
+    with op.batch_alter_table('medicines', schema=None) as batch_op:
+        batch_op.drop_column('opening_stock')
@@ -0,0 +1,74 @@
+"""Add stock_movements ledger and stock_snapshots
+
+Revision ID: f1b27d94c3a8
+Revises: d4a81c6e2f95
+Create Date: 2026-10-18 17:08:41.775310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b27d94c3a8'
+down_revision = 'd4a81c6e2f95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_movements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('movement_date', sa.Date(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('reference_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_movements_medicine_id_movement_date', ['medicine_id', 'movement_date'], unique=False)
+
+    op.create_table('stock_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('medicine_id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_date', sa.Date(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('medicine_id', 'snapshot_date', name='uq_stock_snapshots_medicine_id_snapshot_date')
+    )
+
+    # 用已有的进销退记录回填流水。sales.quantity 已扣除退货，销售流水按原始数量记，退货另记一条
+    op.execute(
+        'INSERT INTO stock_movements (medicine_id, movement_date, created_at, delta, kind, reference_id)'
+        " SELECT medicine_id, purchase_date, CURRENT_TIMESTAMP, quantity, 'purchase', id FROM purchases"
+    )
+    op.execute(
+        'INSERT INTO stock_movements (medicine_id, movement_date, created_at, delta, kind, reference_id)'
+        " SELECT medicine_id, sale_date, CURRENT_TIMESTAMP,"
+        ' -(quantity + COALESCE((SELECT SUM(returns.quantity) FROM returns WHERE returns.sale_id = sales.id), 0)),'
+        " 'sale', id FROM sales"
+    )
+    op.execute(
+        'INSERT INTO stock_movements (medicine_id, movement_date, created_at, delta, kind, reference_id)'
+        " SELECT sales.medicine_id, returns.return_date, CURRENT_TIMESTAMP, returns.quantity, 'return', returns.id"
+        ' FROM returns JOIN sales ON sales.id = returns.sale_id'
+    )
+    # 初始库存记在该药品最早一条流水的日期上
+    op.execute(
+        'INSERT INTO stock_movements (medicine_id, movement_date, created_at, delta, kind, reference_id)'
+        ' SELECT id, COALESCE((SELECT MIN(movement_date) FROM stock_movements'
+        ' WHERE stock_movements.medicine_id = medicines.id), CURRENT_DATE),'
+        " CURRENT_TIMESTAMP, COALESCE(opening_stock, stock), 'opening', NULL FROM medicines"
+    )
+
+
+def downgrade():
+    op.drop_table('stock_snapshots')
+    with op.batch_alter_table('stock_movements', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_movements_medicine_id_movement_date')
+
+    op.drop_table('stock_movements')
@@ -1,14 +1,7 @@
-from app import create_app, db
-from config import Config
+from app import create_app
 
-# 初始化数据库
-Config.init_db()
-
-# 创建应用
+# 创建应用；数据库和表结构由 flask bootstrap（首次）或 flask db upgrade 准备，启动时不再建表或导入数据
 app = create_app()
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()       # 创建所有表
-        Config.import_sql_files() # 导入 SQL 文件
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,46 @@
+// 输入框 + datalist 的远程搜索：选中后把 id 写入隐藏字段
+(function () {
+    function bind(input) {
+        var list = document.getElementById(input.getAttribute('list'));
+        var target = document.getElementById(input.dataset.target);
+        var source = input.dataset.source;
+        var options = {};
+        var timer = null;
+        var latest = 0;
+
+        function search() {
+            var request = ++latest;
+            var url = source + (source.indexOf('?') < 0 ? '?' : '&') + 'q=' + encodeURIComponent(input.value);
+            fetch(url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+                .then(function (response) { return response.json(); })
+                .then(function (items) {
+                    if (request !== latest) {
+                        return;
+                    }
+                    options = {};
+                    list.innerHTML = '';
+                    items.forEach(function (item) {
+                        options[item.label] = item.id;
+                        var option = document.createElement('option');
+                        option.value = item.label;
+                        list.appendChild(option);
+                    });
+                    if (options.hasOwnProperty(input.value)) {
+                        target.value = options[input.value];
+                    }
+                });
+        }
+
+        input.addEventListener('input', function () {
+            if (options.hasOwnProperty(input.value)) {
+                target.value = options[input.value];
+                return;
+            }
+            target.value = '';
+            clearTimeout(timer);
+            timer = setTimeout(search, 200);
+        });
+    }
+
+    document.querySelectorAll('input.typeahead').forEach(bind);
+})();
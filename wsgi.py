@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+run.py stays the single-process development server.
+"""
+from app import create_app
+
+app = create_app()